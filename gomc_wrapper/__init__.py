@@ -1,11 +1,20 @@
 import os
+import copy
 import re
-import time
 import shutil
-import psutil
 import subprocess
 from .parameter import _initialize_parameters
-from .file_handling import read, write_topology, write_parameter, write_molecule, write_pdb, write_jobscript, psfgen
+from .file_handling import read, read_tree, write_topology, write_parameter, write_molecule, write_pdb, write_jobscript, psfgen
+from .topology import compile_topology
+from .pdbfile import read_pdb
+from .trajectory import Trajectory
+from .cache import ConfigurationCache
+from .zmatrix import build_molecules
+from .runner import RunResult
+from .console import ConsoleParser, EquilibrationDetector
+from .scheduler import LocalScheduler
+from .slurm import ArrayJob, SlurmTracker, submit_array
+from .results import ResultStore, config_hash
 
 
 class GOMC:
@@ -16,16 +25,68 @@ class GOMC:
         self.numboxes = 0
         self.boxes = []
         self.cwd = os.getcwd()
+        self.wd = None
 
     # import
-    from .config import add_box, set_box, set_steps, set_prob, set_cbmc, set_freq, set_out
+    from .config import add_box, add_restart_box, set_box, set_steps, set_prob, set_cbmc, set_freq, set_out, set_restart
     from .file_handling import write
+    from .sweep import sweep
+    from .runner import run_async
+    from .segments import segments, run_segments
 
     def set(self, keyword, *values):
         self.parameters[keyword].set(*values)
 
+    def clone(self):
+        """Copy of the GOMC object. The parameters are shared with the
+        original until either of them is modified, such that a clone only
+        costs the values that are changed afterwards
+        """
+        other = copy.copy(self)
+        other.parameters = self.parameters.clone()
+        other.boxes = list(self.boxes)
+        return other
+
+    def derive(self, changes={}, **kwargs):
+        """Clone the GOMC object and change some of its parameters. Keywords
+        that are not valid Python names (e.g. '1-4scaling') are given in
+        'changes'. A value is either a single value, a tuple of values or a
+        list of tuples for keywords that are given once per box
+
+        Example:
+            >>> base = GOMC()
+            >>> variant = base.derive(Temperature=320, RunSteps=10000)
+            >>> variant = base.derive({"1-4scaling": 0.5})
+            >>> variant = base.derive(RcutCoulomb=[(0, 10.0), (1, 12.0)])
+
+        :param changes: keywords and their new values
+        :type changes: dict
+        :returns: modified copy
+        :rtype: GOMC
+        """
+        other = self.clone()
+        for keyword, values in dict(changes, **kwargs).items():
+            if isinstance(values, list) and all(isinstance(value, (tuple, list))
+                                                for value in values):
+                for value in values:
+                    other.set(keyword, *value)
+            elif isinstance(values, tuple):
+                other.set(keyword, *values)
+            else:
+                other.set(keyword, values)
+        return other
+
+    def _path(self, filename):
+        """Path of a file relative to the working directory"""
+        if self.wd is None:
+            return filename
+        return os.path.join(self.wd, filename)
+
     def set_working_directory(self, wd, overwrite=False):
-        """Define working directory
+        """Define working directory. All files are written to and GOMC is
+        run in the working directory, without changing the working
+        directory of the process, such that several GOMC objects can be
+        prepared and run from different threads
         """
         self.wd = wd    # proposed working directory
         if overwrite:
@@ -43,7 +104,6 @@ class GOMC:
                 except FileExistsError:
                     ext += 1
                     self.wd = wd + f"_{ext}"
-        os.chdir(self.wd)
 
     def copy_to_wd(self, *filename):
         """Copy one or several files to working directory.
@@ -55,23 +115,78 @@ class GOMC:
         for file in filename:
             path = os.path.join(self.cwd, file)
             head, tail = os.path.split(path)
-            shutil.copyfile(path, tail)
+            shutil.copyfile(path, self._path(tail))
 
     def run(self, gomc_exec='GOMC_CPU_NVT', num_procs=1, gomc_input='in.conf',
-            slurm=False, slurm_args={}, jobscript='job.sh', wait=True):
-        """Run
+            slurm=False, slurm_args={}, jobscript='job.sh', wait=None,
+            timeout=None, console=None, detector=None, store=None):
+        """Run GOMC locally or through Slurm. By default ('wait' is None),
+        local runs are waited for and Slurm jobs are only submitted. With
+        'wait', a Slurm job is tracked until it has finished, at most
+        'timeout' seconds (forever if None). A TimeoutError is raised if the
+        job has not finished by then, and a RuntimeError if the job cannot
+        be tracked because squeue keeps failing.
+
+        Locally, the console output can be streamed line by line into a
+        ConsoleParser 'console', which keeps live time series of the
+        energies and statistics. With an equilibration 'detector' (e.g.
+        EquilibrationDetector), GOMC is stopped as soon as the detector
+        reports equilibrium during the equilibration steps, and production
+        continues from the latest restart files with OutputName
+        '<OutputName>_prod'. Streamed runs always wait for GOMC to finish.
+
+        If a ResultStore is given as 'store' (or True for the default
+        store), a local run is skipped if an identical job (see
+        config_hash) has finished successfully before, and the directory of
+        its output is returned instead of the job ID
         """
+        if store is True:
+            store = ResultStore()
+        if store is not None and not slurm:
+            key = config_hash(self, gomc_exec)
+            if key is None:
+                # missing input files, the run cannot be identified
+                store = None
+        if store is not None and not slurm:
+            result = store.lookup(key)
+            if result is not None:
+                print("Found finished job in: ", result['directory'])
+                return result['directory']
+
         self.write(gomc_input)
         executable = f"{gomc_exec} +p{num_procs} {gomc_input}"
         if slurm:
-            write_jobscript(jobscript, executable, slurm_args)
-            output = subprocess.check_output(['sbatch', jobscript])
+            write_jobscript(self._path(jobscript), executable, slurm_args)
+            output = subprocess.check_output(['sbatch', jobscript], cwd=self.wd)
             job_id = int(re.findall("([0-9]+)", str(output))[0])
+            if wait:
+                tracker = SlurmTracker()
+                tracker.track(job_id)
+                if not tracker.wait(timeout):
+                    raise TimeoutError(f"Slurm job {job_id} not finished "
+                                       f"after {timeout} seconds")
+        elif console is not None or detector is not None:
+            from .runner import _stream, _production
+            if console is None:
+                console = ConsoleParser()
+            popen, stopped = _stream(self, executable.split(), console, detector)
+            job_id = popen.pid
+            if stopped is not None:
+                print(f"Equilibrated at step {stopped}, starting production")
+                base, ext = os.path.splitext(gomc_input)
+                return _production(self).run(gomc_exec, num_procs,
+                                             f"{base}_prod{ext}", console=console,
+                                             store=store)
         else:
-            popen = subprocess.Popen(executable.split())
+            popen = subprocess.Popen(executable.split(), cwd=self.wd)
             job_id = popen.pid
-            while psutil.pid_exists(job_id) and wait:
-                time.sleep(3)
+            if wait is None or wait:
+                popen.wait()
+
+        if store is not None and not slurm and popen.returncode == 0:
+            from .runner import _outputs
+            wd = self.wd if self.wd is not None else os.getcwd()
+            store.store(key, wd, _outputs(self, wd))
 
         print("Job ID found to be: ", job_id)
         return job_id
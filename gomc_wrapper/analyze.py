@@ -1,10 +1,19 @@
+import io
+import os
+import json
+import time
+import tempfile
+import warnings
+import itertools
+import contextlib
 import numpy as np
-import pandas as pd
-from io import StringIO
+from .pdbfile import read_pdb
 
 
 def average(arr, window):
-    """Average an array arr over a certain window size
+    """Average an array arr over non-overlapping windows of a certain
+    size. Samples at the end that do not fill a window are dropped. See
+    statistics for means with error bars
     """
     if window == 1:
         return arr
@@ -19,66 +28,530 @@ def average(arr, window):
     return avg
 
 
-class Blk:
-    """Class for analyzing bulk (Blk) files.
+def _as_columns(data):
+    """View data as a 2-D float array of shape (numsamples, numcolumns)"""
+    data = np.asarray(data, dtype=np.float64)
+    return data.reshape(len(data), -1)
+
+
+def autocorrelation(data):
+    """Normalized autocorrelation function of every column of 'data',
+    computed with FFTs in one pass
+
+    :param data: time series of shape (numsamples,) or (numsamples,
+        numcolumns)
+    :type data: ndarray
+    :returns: autocorrelation of the same shape as 'data'
+    :rtype: ndarray
+    """
+    x = _as_columns(data)
+    n = len(x)
+    x = x - x.mean(axis=0)
+    size = 1 << int(2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(x, n=size, axis=0)
+    acf = np.fft.irfft(spectrum * spectrum.conj(), n=size, axis=0)[:n]
+    acf /= (n - np.arange(n))[:, np.newaxis]
+    variance = acf[0].copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        acf = np.where(variance > 0, acf / variance, 0.0)
+    acf[0] = 1.0
+    return acf.reshape(np.shape(data))
+
+
+def statistical_inefficiency(data):
+    """Statistical inefficiency g = 1 + 2 sum_t (1 - t/n) C(t) of every
+    column, where the sum over the autocorrelation C(t) is truncated at
+    its first non-positive value. The effective number of independent
+    samples is n / g
+
+    :param data: time series of shape (numsamples,) or (numsamples,
+        numcolumns)
+    :type data: ndarray
+    :rtype: ndarray
+    """
+    acf = _as_columns(autocorrelation(data))
+    n = len(acf)
+    lags = np.arange(1, n)
+    positive = np.cumprod(acf[1:] > 0, axis=0).astype(bool)
+    terms = np.where(positive, acf[1:] * (1 - lags / n)[:, np.newaxis], 0.0)
+    return np.maximum(1 + 2 * terms.sum(axis=0), 1.0)
+
+
+def _chi2_quantile(df, z=2.3263478740):
+    """Quantile of the chi-squared distribution with 'df' degrees of
+    freedom (Wilson-Hilferty approximation). The default 'z' gives the 99 %
+    quantile
+    """
+    df = np.asarray(df, dtype=np.float64)
+    return df * (1 - 2 / (9 * df) + z * np.sqrt(2 / (9 * df)))**3
+
+
+def blocking(data):
+    """Blocking analysis (Flyvbjerg and Petersen) of every column with the
+    M-test of Jonsson (Phys. Rev. E 98, 043304, 2018). The last 2^d samples
+    are repeatedly coarsened by averaging pairs of neighbouring samples,
+    and the standard error of the mean is estimated at every level as if
+    the blocks were independent. The statistic M of a level sums the
+    squared lag-1 autocorrelations of this and all coarser levels,
+    weighted by their number of blocks. It is chi-squared distributed with
+    d - level degrees of freedom if the blocks of the level are
+    uncorrelated
+
+    :param data: time series of shape (numsamples,) or (numsamples,
+        numcolumns)
+    :type data: ndarray
+    :returns: standard errors and M statistics, both of shape (d,
+        numcolumns), and the number of blocks of every level
+    :rtype: tuple
+    """
+    x = _as_columns(data)
+    d = int(len(x)).bit_length() - 1
+    x = x[len(x) - (1 << d):]
+    mean = x.mean(axis=0)
+    variances, covariances, numblocks = [], [], []
+    for level in range(d):
+        n = len(x)
+        deviations = x - mean
+        variances.append((deviations**2).mean(axis=0))
+        covariances.append((deviations[:-1] * deviations[1:]).sum(axis=0) / n)
+        numblocks.append(n)
+        x = 0.5 * (x[0::2] + x[1::2])
+    variances = np.asarray(variances).reshape(d, -1)
+    covariances = np.asarray(covariances).reshape(d, -1)
+    numblocks = np.asarray(numblocks, dtype=np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        terms = numblocks[:, np.newaxis] * np.where(
+            variances > 0, covariances / variances, 0.0)**2
+    m = np.cumsum(terms[::-1], axis=0)[::-1]
+    errors = np.sqrt(variances / numblocks[:, np.newaxis])
+    return errors, m, numblocks
+
+
+def statistics(data, method='autocorrelation', min_blocks=32):
+    """Mean, standard error and effective sample size of every column of
+    correlated time series. With method 'autocorrelation', the error
+    follows from the statistical inefficiency. With method 'blocking', the
+    error is taken from the first blocking level that passes the M-test at
+    the 99 % level, see blocking. Series where this level has fewer than
+    'min_blocks' blocks, i.e. that are too short compared to their
+    correlation time, get NaN as error and effective sample size, with a
+    warning
+
+    Example:
+        >>> mean, error, neff = statistics(blk.to_array(["TOT_EN", "PRESSURE"]))
+
+    :param data: time series of shape (numsamples,) or (numsamples,
+        numcolumns)
+    :type data: ndarray
+    :param method: 'autocorrelation' or 'blocking'
+    :type method: str
+    :param min_blocks: minimum number of blocks of the blocking level the
+        error is taken from
+    :type min_blocks: int
+    :returns: mean, standard error and effective sample size, scalars for
+        a single series and arrays of length numcolumns otherwise
+    :rtype: tuple
+    """
+    x = _as_columns(data)
+    n = len(x)
+    if n < 2:
+        raise ValueError("At least two samples are needed")
+    mean = x.mean(axis=0)
+    variance = x.var(axis=0, ddof=1)
+    if method == 'autocorrelation':
+        neff = n / statistical_inefficiency(x)
+        error = np.sqrt(variance / neff)
+    elif method == 'blocking':
+        errors, m, numblocks = blocking(x)
+        d = len(numblocks)
+        passed = m < _chi2_quantile(d - np.arange(d))[:, np.newaxis]
+        level = passed.argmax(axis=0)
+        valid = passed.any(axis=0) & (numblocks[level] >= min_blocks)
+        error = np.where(valid, errors[level, np.arange(x.shape[1])], np.nan)
+        if not valid.all():
+            warnings.warn(f"Blocking failed for {np.sum(~valid)} of "
+                          f"{len(valid)} series, the series are too short "
+                          "compared to their correlation time", RuntimeWarning)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            neff = np.where(error > 0, np.minimum(variance / error**2, n), n)
+            neff = np.where(valid, neff, np.nan)
+    else:
+        raise NotImplementedError(f"Method {method} is not supported")
+    if np.ndim(data) == 1:
+        return mean[0], error[0], neff[0]
+    return mean, error, neff
+
+
+def _open(filename):
+    """Open a file for reading, or use an open file object as is (without
+    closing it)
+    """
+    if hasattr(filename, "read"):
+        return contextlib.nullcontext(filename)
+    return open(filename, 'r')
+
+
+def _read_header(f):
+    """Read the leading comment lines of a GOMC output table. The last one
+    holds the column names, the ones before are information lines.
+    Returns the information lines, the column names and the first data
+    line
+    """
+    comments = []
+    line = f.readline()
+    while line.startswith("#"):
+        comments.append(line)
+        line = f.readline()
+    if len(comments) == 0:
+        raise ValueError("No header found")
+    info = [comment[1:].strip() for comment in comments[:-1]]
+    return info, comments[-1][1:].split(), line
+
+
+def read_table(filename, usecols=None, dtype=np.float64):
+    """Read columns of a GOMC output table, i.e. a block average (Blk) or
+    free energy file. Only the requested columns are parsed, straight into
+    NumPy arrays
+
+    :param filename: path to output file
+    :type filename: str or file
+    :param usecols: names of the columns to read, all by default
+    :type usecols: list of str
+    :param dtype: data type of the arrays, e.g. np.float32 to halve the
+        memory usage
+    :type dtype: type
+    :returns: information lines, column names and dictionary of columns
+    :rtype: tuple
+    """
+    with _open(filename) as f:
+        info, keywords, first = _read_header(f)
+        if usecols is None:
+            usecols = keywords
+        missing = [column for column in usecols if column not in keywords]
+        if missing:
+            raise KeyError(f"No column(s) {', '.join(missing)} in {filename}")
+        indices = [keywords.index(column) for column in usecols]
+        if first.strip():
+            data = np.loadtxt(itertools.chain([first], f), comments="#",
+                              usecols=indices, dtype=dtype, ndmin=2)
+        else:
+            data = np.empty((0, len(indices)), dtype=dtype)
+    return info, keywords, {column: data[:, i] for i, column in enumerate(usecols)}
+
+
+def _cache_dir(filename):
+    head, tail = os.path.split(os.path.abspath(filename))
+    return os.path.join(head, f".{tail}.npcache")
+
+
+def _load_index(directory, signature):
+    """Load the index of a sidecar cache, None if it is missing or does not
+    match the signature (modification time and size) of the source file
+    """
+    try:
+        with open(os.path.join(directory, "index.json"), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('signature') != signature:
+        return None
+    return index
+
+
+def _save_atomic(path, save):
+    """Write a file through 'save(file)' to a temporary file that is
+    renamed into place, such that readers never see a partial file
+    """
+    fd, tmpfile = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save(f)
+        os.replace(tmpfile, path)
+    except BaseException:
+        os.remove(tmpfile)
+        raise
+
+
+def read_cached_table(filename, usecols=None, dtype=np.float64):
+    """Read columns of a GOMC output table like read_table, through a
+    sidecar cache next to the file ('.<filename>.npcache'). Every column
+    that has been parsed is stored as a .npy file and loaded memory-mapped
+    on later reads, as long as the modification time and size of the file
+    are unchanged. The cache is skipped if it cannot be written
+
+    :returns: information lines, column names and dictionary of columns
+    :rtype: tuple
+    """
+    directory = _cache_dir(filename)
+    stat = os.stat(filename)
+    signature = [stat.st_mtime_ns, stat.st_size]
+    char = np.dtype(dtype).char
+
+    index = _load_index(directory, signature)
+    if index is None:
+        info, keywords, data = read_table(filename, usecols, dtype)
+        index = {'signature': signature, 'info': info, 'keywords': keywords,
+                 'columns': []}
+    else:
+        info, keywords = index['info'], index['keywords']
+        if usecols is None:
+            usecols = keywords
+        data = {}
+        for column in usecols:
+            if column not in keywords:
+                raise KeyError(f"No column {column} in {filename}")
+            key = f"{keywords.index(column)}{char}"
+            if key in index['columns']:
+                try:
+                    data[column] = np.load(os.path.join(directory, f"{key}.npy"),
+                                           mmap_mode='r')
+                except (OSError, ValueError):
+                    index['columns'].remove(key)
+        missing = [column for column in usecols if column not in data]
+        if missing:
+            data.update(read_table(filename, missing, dtype)[2])
+
+    # store newly parsed columns
+    new = [column for column in data
+           if f"{keywords.index(column)}{char}" not in index['columns']]
+    if new:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for column in new:
+                key = f"{keywords.index(column)}{char}"
+                _save_atomic(os.path.join(directory, f"{key}.npy"),
+                             lambda f: np.save(f, data[column]))
+                index['columns'].append(key)
+            _save_atomic(os.path.join(directory, "index.json"),
+                         lambda f: f.write(json.dumps(index).encode()))
+        except OSError:
+            pass
+    return info, keywords, data
+
+
+class Table:
+    """Class for analyzing GOMC output tables with a commented header, i.e.
+    block average (Blk) and free energy files. Columns not read initially
+    are read on first access.
     Parameters
     ----------------------
-    :param filename: path to lammps log file
+    :param filename: path to output file
     :type filename: string or file
+    :param usecols: names of the columns to read, all by default
+    :type usecols: list of str
+    :param dtype: data type of the columns, e.g. np.float32
+    :type dtype: type
+    :param cache: read columns through a sidecar cache of memory-mapped
+        NumPy arrays, see read_cached_table. The columns are read-only then
+    :type cache: bool
     """
-    def __init__(self, filename):
-        # Identifiers for places in the log file
-        if hasattr(filename, "read"):
-            logfile = filename
+    def __init__(self, filename, usecols=None, dtype=np.float64, cache=True):
+        self.filename = filename
+        self.dtype = dtype
+        if hasattr(filename, "read") or not cache:
+            self._read = read_table
         else:
-            logfile = open(filename, 'r')
-        self.read_file_to_dataframe(logfile)
-
-    def read_file_to_dataframe(self, logfile):
-        # read three first lines, which should be information lines
-        string = logfile.readline()[1:]  # string should start with the kws
-        self.keywords = string.split()
-        contents = logfile.read()
-        self.contents = pd.read_table(StringIO(string + contents), sep=r'\s+')
+            self._read = read_cached_table
+        self.info, self.keywords, self.data = self._read(filename, usecols, dtype)
 
     def find(self, entry_name):
-        return np.asarray(self.contents[entry_name])
+        if entry_name not in self.data:
+            if hasattr(self.filename, "read"):
+                raise KeyError(f"Column {entry_name} was not read")
+            self.data.update(self._read(self.filename, [entry_name], self.dtype)[2])
+        return self.data[entry_name]
 
     def get_keywords(self):
         """Return list of available data columns in the log file."""
         print(", ".join(self.keywords))
 
+    def to_array(self, columns=None):
+        """Columns as a 2-D array of shape (numrows, numcolumns)"""
+        if columns is None:
+            columns = self.keywords
+        return np.column_stack([self.find(column) for column in columns])
+
+    def statistics(self, columns=None, discard=0, method='autocorrelation'):
+        """Mean, standard error and effective sample size of columns (all
+        but STEPS by default), analyzed together in one pass. The first
+        'discard' rows are skipped, e.g. to exclude equilibration
+
+        :returns: (mean, error, neff) for every column
+        :rtype: dict
+        """
+        if columns is None:
+            columns = [column for column in self.keywords if column != "STEPS"]
+        mean, error, neff = statistics(self.to_array(columns)[discard:], method)
+        return {column: (mean[i], error[i], neff[i])
+                for i, column in enumerate(columns)}
 
-class FreeEnergy:
-    """Class for analyzing free energy files.
+    @property
+    def contents(self):
+        """Columns read so far as a pandas DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(self.data)
+
+
+class Blk(Table):
+    """Class for analyzing bulk (Blk) files.
     Parameters
     ----------------------
-    :param filename: path to lammps log file
+    :param filename: path to Blk file
     :type filename: string or file
     """
-    def __init__(self, filename):
-        # Identifiers for places in the log file
-        if hasattr(filename, "read"):
-            logfile = filename
+
+
+class FreeEnergy(Table):
+    """Class for analyzing free energy files. The information line (state
+    and lambda values) is found in 'info'.
+    Parameters
+    ----------------------
+    :param filename: path to free energy file
+    :type filename: string or file
+    """
+
+
+class TableFollower:
+    """Follow a GOMC output table that is still being written, e.g. the Blk
+    file of a running simulation. The byte offset of the last complete
+    line is remembered, such that every update only parses the lines
+    appended since the previous one. The file system is polled; there is
+    no dependency on inotify.
+
+    Example:
+        >>> follower = TableFollower("Blk_output_BOX_0.dat", usecols=["TOT_EN"])
+        >>> for chunk in follower.follow(interval=60):
+        ...     print(len(follower.find("TOT_EN")), chunk["TOT_EN"].mean())
+
+    :param filename: path to output file
+    :type filename: str
+    :param usecols: names of the columns to read, all by default
+    :type usecols: list of str
+    :param dtype: data type of the columns, e.g. np.float32
+    :type dtype: type
+    """
+    def __init__(self, filename, usecols=None, dtype=np.float64):
+        self.filename = filename
+        self.usecols = usecols
+        self.dtype = dtype
+        self.reset()
+
+    def reset(self):
+        """Forget all data and start from the beginning of the file"""
+        self.offset = 0
+        self.info = None
+        self.keywords = None
+        self.chunks = {}
+
+    def _parse_header(self, lines):
+        """Parse header from the complete lines at the start of the file.
+        Returns the number of header lines, 0 if the header is incomplete
+        """
+        numheader = 0
+        while numheader < len(lines) and lines[numheader].startswith(b"#"):
+            numheader += 1
+        if numheader == 0 or numheader == len(lines):
+            # the header is complete when the first data line is written
+            return 0
+        header = io.StringIO(b"\n".join(lines[:numheader + 1]).decode())
+        self.info, self.keywords, _ = _read_header(header)
+        if self.usecols is None:
+            self.usecols = self.keywords
+        missing = [column for column in self.usecols if column not in self.keywords]
+        if missing:
+            raise KeyError(f"No column(s) {', '.join(missing)} in {self.filename}")
+        self.chunks = {column: [] for column in self.usecols}
+        return numheader
+
+    def update(self):
+        """Parse the complete lines appended since the last update
+
+        :returns: new rows as a dictionary of columns (possibly empty)
+        :rtype: dict
+        """
+        with open(self.filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset:
+                # file was truncated or rewritten
+                self.reset()
+            f.seek(self.offset)
+            block = f.read(size - self.offset)
+        block = block[:block.rfind(b"\n") + 1]
+        lines = block.splitlines()
+
+        numheader = 0
+        if self.keywords is None:
+            numheader = self._parse_header(lines)
+            if numheader == 0:
+                return {}
+        self.offset += len(block)
+
+        lines = [line for line in lines[numheader:]
+                 if line.strip() and not line.startswith(b"#")]
+        indices = [self.keywords.index(column) for column in self.usecols]
+        if lines:
+            data = np.loadtxt(lines, usecols=indices, dtype=self.dtype, ndmin=2)
         else:
-            logfile = open(filename, 'r')
-        self.read_file_to_dataframe(logfile)
+            data = np.empty((0, len(indices)), dtype=self.dtype)
+        chunk = {column: data[:, i] for i, column in enumerate(self.usecols)}
+        for column, values in chunk.items():
+            self.chunks[column].append(values)
+        return chunk
 
-    def read_file_to_dataframe(self, logfile):
-        # read three first lines, which should be information lines
-        info = logfile.readline()
-        string = logfile.readline()[1:]  # string should start with the kws
-        self.keywords = string.split()
-        contents = logfile.read()
-        self.contents = pd.read_table(StringIO(string + contents), sep=r'\s+')
+    def find(self, entry_name):
+        """All rows of a column read so far"""
+        if self.keywords is None:
+            return np.empty(0, dtype=self.dtype)
+        chunks = self.chunks[entry_name]
+        if len(chunks) != 1:
+            # merge chunks, such that they are only concatenated once
+            chunks[:] = [np.concatenate(chunks) if chunks
+                         else np.empty(0, dtype=self.dtype)]
+        return chunks[0]
+
+    def follow(self, interval=1.0, timeout=None):
+        """Poll the file every 'interval' seconds and yield every non-empty
+        chunk of new rows. Stops when no new rows have appeared for
+        'timeout' seconds (never by default)
+        """
+        last = time.time()
+        while True:
+            if os.path.isfile(self.filename):
+                chunk = self.update()
+                if chunk and len(next(iter(chunk.values()))) > 0:
+                    last = time.time()
+                    yield chunk
+            if timeout is not None and time.time() - last > timeout:
+                return
+            time.sleep(interval)
+
+
+class Restart:
+    """Class for analyzing restart (and other coordinate) files.
+    Parameters
+    ----------------------
+    :param filename: path to PDB file
+    :type filename: string or file
+    """
+    def __init__(self, filename):
+        pdb = read_pdb(filename)
+        self.atoms = pdb.atoms
+        self.cell = pdb.cell
+        self.keywords = list(self.atoms.dtype.names)
 
     def find(self, entry_name):
-        return np.asarray(self.contents[entry_name])
+        return self.atoms[entry_name]
 
     def get_keywords(self):
-        """Return list of available data columns in the log file."""
+        """Return list of available data columns in the restart file."""
         print(", ".join(self.keywords))
 
+    @property
+    def nummol(self):
+        """Number of molecules (residues) in the file."""
+        resids = self.atoms['resid']
+        return int(np.count_nonzero(resids[1:] != resids[:-1])) + (len(resids) > 0)
+
 
 if __name__ == "__main__":
     window = 10
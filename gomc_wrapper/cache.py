@@ -0,0 +1,157 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+
+def _default_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "gomc_wrapper",
+                        "configurations")
+
+
+def _hash_file(filename, skip_comments=False):
+    """Hash the content of a file. With 'skip_comments', title lines
+    starting with '*' and remarks are ignored, such that generated files
+    that only differ in their time stamp hash equally
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for line in f:
+            if skip_comments and line.startswith((b"*", b"REMARK")):
+                continue
+            sha.update(line)
+    return sha.hexdigest()
+
+
+class ConfigurationCache:
+    """Content-addressed cache of packed initial configurations (coordinate
+    and PSF files). Entries are keyed by a hash of the molecule and
+    topology files and the packing parameters, and the cache is bounded in
+    size by evicting the least recently used entries.
+
+    Example:
+        >>> cache = ConfigurationCache(max_size=10 * 1024**3)
+        >>> gomc.set_box(0, 512, TIP4P2005(), massdensity=0.6, cache=cache)
+
+    :param directory: cache directory. Defaults to
+        ~/.cache/gomc_wrapper/configurations
+    :type directory: str
+    :param max_size: maximum total size of the cache in bytes
+    :type max_size: int
+    :param link: hardlink cached files into the job directory if possible
+        instead of copying them. Linked files share their content with the
+        cache entry, and must be replaced rather than modified in place
+    :type link: bool
+    """
+    def __init__(self, directory=None, max_size=10 * 1024**3, link=False):
+        if directory is None:
+            directory = _default_cache_dir()
+        self.directory = directory
+        self.max_size = max_size
+        self.link = link
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, molecule, nummol, length, tolerance=2.0, seed=None,
+            packer='packmol', topology=None):
+        """Compute cache key of a packed configuration
+
+        :param molecule: PDB file of a single molecule
+        :type molecule: str
+        :param topology: topology file used to generate the PSF file
+        :type topology: str
+        """
+        description = {'molecule': _hash_file(molecule, skip_comments=True),
+                       'nummol': int(nummol), 'length': f"{float(length):.6f}",
+                       'tolerance': float(tolerance), 'seed': seed,
+                       'packer': packer}
+        if topology is not None:
+            description['topology'] = _hash_file(topology, skip_comments=True)
+        string = json.dumps(description, sort_keys=True)
+        return hashlib.sha256(string.encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, coordinates, structure=None):
+        """Place cached files of entry 'key' at 'coordinates' and
+        'structure'. Returns False if there is no such entry
+        """
+        entry = self._entry(key)
+        files = [("coordinates", coordinates), ("structure", structure)]
+        for name, target in files:
+            if target is not None and not os.path.isfile(os.path.join(entry, name)):
+                return False
+        for name, target in files:
+            if target is not None:
+                self._place(os.path.join(entry, name), target)
+        # mark entry as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return True
+
+    def _place(self, source, target):
+        if os.path.lexists(target):
+            os.remove(target)
+        if self.link:
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(source, target)
+
+    def store(self, key, coordinates, structure=None):
+        """Store files 'coordinates' and 'structure' under entry 'key' and
+        evict least recently used entries if the cache is too large
+        """
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return
+        tmpdir = tempfile.mkdtemp(prefix=".tmp_", dir=self.directory)
+        shutil.copyfile(coordinates, os.path.join(tmpdir, "coordinates"))
+        if structure is not None:
+            shutil.copyfile(structure, os.path.join(tmpdir, "structure"))
+        try:
+            os.rename(tmpdir, entry)
+        except OSError:
+            # stored concurrently by another process
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        self.evict()
+
+    def size(self):
+        """Total size of all entries in bytes."""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, file))
+                           for file in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), entry, size))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits within
+        'max_size'
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for mtime, entry, size in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+        for _, entry, _ in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
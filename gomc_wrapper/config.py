@@ -15,11 +15,32 @@ def add_box(self, coordinates, structure, hmatrix):
              hmatrix[2][0], hmatrix[2][1], hmatrix[2][2])
 
 
+def add_restart_box(self, coordinates, structure):
+    """Add box from a restart file (or any other PDB file with a CRYST1
+    record). The box dimensions are read from the coordinate file
+    """
+    from .pdbfile import read_cell, cell_to_hmatrix
+
+    cell = read_cell(self._path(coordinates))
+    if cell is None:
+        raise ValueError(f"No CRYST1 record found in {coordinates}")
+    self.add_box(coordinates, structure, cell_to_hmatrix(cell))
+
+
 def set_box(self, id, nummol, substance, numberdensity=None, massdensity=None,
-            volume=None, pbc=0):
-    """Set box with box id 'id'. Density is number density
+            volume=None, pbc=0, packer='packmol', seed=None, num_procs=1,
+            cache=None):
+    """Set box with box id 'id'. Density is number density. The initial
+    configuration is packed by 'packer' using 'num_procs' Packmol
+    processes, see write_pdb. Use 'packmol' or 'lattice' for liquid
+    densities. If a ConfigurationCache is given as 'cache' (or True for the
+    default cache), packed coordinate and PSF files are reused across calls
+    with the same molecule, number of molecules, box length and seed. All
+    files are written to the working directory of the GOMC object
     """
+    import os
     from .file_handling import read, write_topology, write_parameter, write_molecule, write_pdb, write_jobscript, psfgen
+    from .cache import ConfigurationCache
 
     assert [numberdensity, massdensity, volume].count(None) == 2, \
         "Either volume or density has to be given"
@@ -38,25 +59,43 @@ def set_box(self, id, nummol, substance, numberdensity=None, massdensity=None,
     topofile = "topology.inp"
     psffile = f"box_{id}.psf"
     paramfile = "param.inp"
+    path = self._path
 
     # write molecule file
     write_molecule(bonds=substance.bonds, angles=substance.angles,
-                   filename=molfile)
-
-    # write pdb file using Packmol
-    write_pdb(nummol, box_length, single_mol=molfile, outfile=coordfile)
+                   filename=path(molfile))
 
     # write topology file
     write_topology(atoms=substance.atom_types, labels=substance.atom_labels,
                    mass=substance.masses, charge=substance.charges,
                    bonds=substance.bond_types, molname=substance.__repr__(),
-                   filename=topofile)
-
-    # generate PSF file
-    psfgen(coordinates=coordfile, topology=topofile, genfile=psffile)
+                   filename=path(topofile))
+
+    if cache is True:
+        cache = ConfigurationCache()
+    if cache is not None:
+        key = cache.key(path(molfile), nummol, box_length, seed=seed,
+                        packer=packer, topology=path(topofile))
+    if cache is None or not cache.fetch(key, path(coordfile), path(psffile)):
+        # files of an earlier cache hit might be linked to the cache entry,
+        # and are replaced instead of written through
+        for file in (coordfile, psffile):
+            if os.path.lexists(path(file)):
+                os.remove(path(file))
+
+        # write pdb file using Packmol or the built-in packer
+        write_pdb(nummol, box_length, single_mol=molfile, outfile=coordfile,
+                  packer=packer, seed=seed, num_procs=num_procs, cwd=self.wd)
+
+        # generate PSF file
+        psfgen(coordinates=path(coordfile), topology=path(topofile),
+               genfile=path(psffile))
+
+        if cache is not None:
+            cache.store(key, path(coordfile), path(psffile))
 
     # generate parameter file
-    write_parameter(paramfile)
+    write_parameter(path(paramfile))
 
     # set parameters related to the force-field
     for key, value in substance.gomc_params.items():
@@ -134,3 +173,20 @@ def set_out(self, energy=False, pressure=False, molnum=False, density=False,
     for key, value in dct.items():
         if value:
             self.set(key, "true", "true")
+
+
+def set_restart(self, outputname, checkpoint=False):
+    """Restart from the files written by a previous run with OutputName
+    'outputname', i.e. <outputname>_BOX_<id>_restart.pdb and .psf for every
+    box. With 'checkpoint', the state of the previous run is restored from
+    its checkpoint file as well (RestartCheckpoint)
+    """
+    boxes = sorted(self.parameters.get("Coordinates").values)
+    if len(boxes) == 0:
+        boxes = range(self.numboxes)
+    self.set("Restart", True)
+    if checkpoint:
+        self.set("RestartCheckpoint", True)
+    for box in boxes:
+        self.set("Coordinates", box, f"{outputname}_BOX_{box}_restart.pdb")
+        self.set("Structure", box, f"{outputname}_BOX_{box}_restart.psf")
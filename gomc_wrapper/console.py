@@ -0,0 +1,131 @@
+import time
+import numpy as np
+
+
+class ConsoleParser:
+    """Parser of the GOMC console output, keeping time series of the
+    energy (ENER), statistics (STAT) and move (MOVE) records that are
+    printed every ConsoleFreq step. Lines are fed one at a time while GOMC
+    is running, such that the series can be inspected live. The time every
+    record was parsed at is kept as well.
+
+    Example:
+        >>> console = ConsoleParser()
+        >>> gomc.run(console=console, wait=True)
+        >>> console.series("STAT", "TOT_DENSITY", box=0)
+    """
+    def __init__(self):
+        self.titles = {}
+        self.records = {}
+        self.times = {}
+        self.step = None
+
+    def feed(self, line):
+        """Parse a single line of console output. Returns True if the line
+        is a new record
+        """
+        tokens = line.split()
+        if len(tokens) < 2 or not tokens[0].endswith(":"):
+            return False
+        record = tokens[0][:-1]
+        if record.endswith("TITLE"):
+            # e.g. ETITLE gives the columns of ENER_0, ENER_1 etc.
+            self.titles[record[0]] = tokens[1:]
+            return False
+        name, _, box = record.rpartition("_")
+        if not box.isdigit() or name[:1] not in self.titles:
+            return False
+        values = []
+        for token in tokens[1:]:
+            try:
+                values.append(float(token))
+            except ValueError:
+                values.append(np.nan)
+        self.records.setdefault((name, int(box)), []).append(values)
+        self.times.setdefault((name, int(box)), []).append(time.time())
+        if not np.isnan(values[0]):
+            self.step = int(values[0])
+        return True
+
+    def columns(self, record):
+        """Column names of a record, e.g. 'ENER'"""
+        return self.titles.get(record[0], [])
+
+    def series(self, record, column, box=0, last=None):
+        """Time series of a column of a record in box 'box'
+
+        :param record: record name, e.g. 'ENER' or 'STAT'
+        :type record: str
+        :param column: column name, e.g. 'TOTAL' or 'TOT_DENSITY'
+        :type column: str
+        :param last: return only the last 'last' samples
+        :type last: int
+        :rtype: ndarray
+        """
+        columns = self.columns(record)
+        if column not in columns:
+            raise ValueError(f"No column {column} in record {record}")
+        i = columns.index(column)
+        rows = self.records.get((record, box), [])
+        if last is not None:
+            rows = rows[-last:]
+        return np.asarray([row[i] if i < len(row) else np.nan for row in rows])
+
+    def timestamps(self, record, box=0, last=None):
+        """Times (seconds since the epoch) the records of 'record' in box
+        'box' were parsed at
+
+        :param last: return only the last 'last' times
+        :type last: int
+        :rtype: ndarray
+        """
+        times = self.times.get((record, box), [])
+        if last is not None:
+            times = times[-last:]
+        return np.asarray(times)
+
+
+class EquilibrationDetector:
+    """Detect equilibration from the drift of a console time series. The
+    system is considered equilibrated when the slope of a linear fit to
+    the last 'window' samples is not significantly different from zero,
+    i.e. smaller than 'z' times its standard error.
+
+    :param record: record name, e.g. 'ENER' or 'STAT'
+    :type record: str
+    :param column: column name, e.g. 'TOTAL' or 'TOT_DENSITY'
+    :type column: str
+    :param box: box ID
+    :type box: int
+    :param window: number of samples the drift is estimated from
+    :type window: int
+    :param z: significance threshold in units of the standard error
+    :type z: float
+    """
+    def __init__(self, record='ENER', column='TOTAL', box=0, window=50,
+                 z=2.0):
+        self.record = record
+        self.column = column
+        self.box = box
+        self.window = window
+        self.z = z
+
+    def __call__(self, console):
+        """Return True if the series of 'console' is equilibrated"""
+        try:
+            values = console.series(self.record, self.column, self.box,
+                                    last=self.window)
+        except ValueError:
+            return False
+        if len(values) < self.window or np.any(np.isnan(values)):
+            return False
+        x = np.arange(len(values)) - (len(values) - 1) / 2
+        slope = np.dot(x, values) / np.dot(x, x)
+        residuals = values - values.mean() - slope * x
+        stderr = np.sqrt(np.dot(residuals, residuals) / (len(values) - 2)
+                         / np.dot(x, x))
+        return abs(slope) <= self.z * stderr
+
+    def window_start(self, console):
+        """Time the first sample of the current window was parsed at"""
+        return console.timestamps(self.record, self.box, last=self.window)[0]
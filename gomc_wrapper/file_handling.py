@@ -1,128 +1,149 @@
 import os
+import shutil
 import datetime
+import tempfile
+import subprocess
+import itertools
 import numpy as np
-import pandas as pd
-from io import StringIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .pdbfile import read_pdb, write_atoms, iter_pdb, count_atoms
+from .packer import pack_pdb
+from .topology import compile_topology
+from .zmatrix import build_molecules
 
 
-def read(filename='in.conf'):
-    """Read GOMC parameter file
+# least recently used parsed config files, keyed by path, modification
+# time and size
+_parsed = OrderedDict()
+_PARSE_CACHE_SIZE = 1024
+
+
+def _tokenize(text):
+    """Split GOMC config text into lines of tokens, dropping comments and
+    blank lines
+    """
+    lines = []
+    for number, line in enumerate(text.splitlines(), 1):
+        tokens = line.split("#", 1)[0].split()
+        if tokens:
+            lines.append((number, tokens))
+    return lines
+
+
+def read(filename='in.conf', use_cache=True):
+    """Read GOMC parameter file. Comments (also inline) and unknown
+    keywords are ignored. The last 1024 parsed files are cached by path,
+    modification time and size, and a cached file is returned as a clone
+
+    :param filename: GOMC config file
+    :type filename: str
+    :param use_cache: use (and fill) the parse cache
+    :type use_cache: bool
+    :rtype: GOMC
     """
     from .__init__ import GOMC
+    from .parameter import SCHEMA
+
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if use_cache and key in _parsed:
+        _parsed.move_to_end(key)
+        return _parsed[key].clone()
+
+    with open(path, 'r') as f:
+        text = f.read()
     gomc = GOMC()
-    with open(filename, 'r') as f:
-        for line in f:
-            if line[0].isalpha():
-                # ignoring all lines that do not start with a letter
-                splitted = line.split()
-                gomc.set(splitted[0], *tuple(splitted[1:]))
+    for number, tokens in _tokenize(text):
+        if tokens[0] not in SCHEMA:
+            continue
+        try:
+            gomc.set(tokens[0], *tokens[1:])
+        except (ValueError, IndexError) as e:
+            raise ValueError(f"{filename}:{number}: invalid values for "
+                             f"{tokens[0]}: {' '.join(tokens[1:])}") from e
+    if use_cache:
+        _parsed[key] = gomc.clone()
+        while len(_parsed) > _PARSE_CACHE_SIZE:
+            _parsed.popitem(last=False)
     return gomc
 
 
+def read_tree(directory, filename='in.conf', use_cache=True):
+    """Read all GOMC parameter files named 'filename' in a directory tree.
+    Files are read one after another: parsing is pure Python and holds the
+    GIL, so threads do not speed it up, and a process pool would have to
+    pickle every parsed object back, which costs about as much as parsing
+    it. Rereading an unchanged tree is served by the parse cache
+
+    :param directory: root of the directory tree
+    :type directory: str
+    :param filename: name of the config files
+    :type filename: str
+    :returns: GOMC objects keyed by the path of their config file
+    :rtype: dict
+    """
+    paths = [os.path.join(root, filename)
+             for root, dirs, files in sorted(os.walk(directory))
+             if filename in files]
+    return {path: read(path, use_cache) for path in paths}
+
+
+def _section(title):
+    return "\n" + "#" * 76 + "\n" + "# " + "=" * 8 + "-" * 25 + f" {title} " \
+        + "-" * 25 + "=" * 8 + "\n" + "#" * 76 + "\n"
+
+
+def _subsection(title):
+    return "\n" + "#" * 36 + "\n" + f"# {title}" + "\n" + "#" * 36 + "\n"
+
+
+# section and subsection (verbose only) headings written in front of keywords
+_HEADINGS = {"ParaTypeCHARMM": (None, "FORCEFIELD"),
+             "Coordinates": (None, "INPUT FILES"),
+             "GEMC": ("SYSTEM", "GEMC TYPE"),
+             "Pressure": (None, "SIMULATION CONDITION"),
+             "ElectroStatic": (None, "ELECTROSTATIC"),
+             "PressureCalc": (None, "PRESSURE CALCULATION"),
+             "RunSteps": (None, "STEPS"),
+             "DisFreq": (None, "MOVE FREQUENCY"),
+             "CellBasisVector1": (None, "BOX DIMENSIONS #, X, Y, Z"),
+             "CBMC_First": (None, "CBMC TRIALS"),
+             "FreeEnergyCalc": (None, "FREE ENERGY COMPUTATIONS"),
+             "OutputName": ("OUTPUT", "statistics filename add"),
+             "CoordinatesFreq": (None, "enable, frequency"),
+             "OutEnergy": (None, "enable: blk avg., fluct.")}
+
+# rendered headings, indexed by verbosity
+_RENDERED_HEADINGS = {
+    verbose: {key: (_section(section) if section else "")
+              + (_subsection(subsection) if verbose else "")
+              for key, (section, subsection) in _HEADINGS.items()}
+    for verbose in (False, True)}
+
+
 def write(self, filename='in.conf', verbose=True):
-    """Write GOMC parameter file
+    """Write GOMC parameter file, relative to the working directory of the
+    GOMC object. The lines of every parameter are rendered once and cached
+    until the parameter is set again, such that rewriting a file after a
+    few changes only re-renders the changed lines
     """
     now = datetime.datetime.now()
+    headings = _RENDERED_HEADINGS[bool(verbose)]
 
-    with open(filename, 'w') as f:
-        f.write("#" * 30 + "\n")
-        f.write("## Written by GOMC-wrapper \n")
-        f.write(f"## DATE: {now:%Y-%m-%d %H:%M:%S}\n")
-        f.write("#" * 30 + "\n")
-
-        f.write("\n" + "#" * 76 + "\n")
-        f.write("# " + "=" * 8 + "-" * 25 + " INPUT " + "-" * 25 + "=" * 8)
-        f.write("\n" + "#" * 76 + "\n")
-
-        for key, obj in self.parameters.items():
-            if key == "ParaTypeCHARMM" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# FORCEFIELD")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "Coordinates" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# INPUT FILES")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "GEMC":
-                f.write("\n" + "#" * 76 + "\n")
-                f.write("# " + "=" * 8 + "-" * 25 + " SYSTEM " + "-" * 25 + "=" * 8)
-                f.write("\n" + "#" * 76 + "\n")
-
-                if verbose:
-                    f.write("\n" + "#" * 36 + "\n")
-                    f.write("# GEMC TYPE")
-                    f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "Pressure" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# SIMULATION CONDITION")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "ElectroStatic" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# ELECTROSTATIC")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "PressureCalc" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# PRESSURE CALCULATION")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "RunSteps" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# STEPS")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "DisFreq" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# MOVE FREQUENCY")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "CellBasisVector1" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# BOX DIMENSIONS #, X, Y, Z")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "CBMC_First" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# CBMC TRIALS")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "FreeEnergyCalc" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# FREE ENERGY COMPUTATIONS")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "OutputName":
-                f.write("\n" + "#" * 76 + "\n")
-                f.write("# " + "=" * 8 + "-" * 25 + " OUTPUT " + "-" * 25 + "=" * 8)
-                f.write("\n" + "#" * 76 + "\n")
-
-                if verbose:
-                    f.write("\n" + "#" * 36 + "\n")
-                    f.write("# statistics filename add")
-                    f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "CoordinatesFreq" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# enable, frequency")
-                f.write("\n" + "#" * 36 + "\n")
-
-            elif key == "OutEnergy" and verbose:
-                f.write("\n" + "#" * 36 + "\n")
-                f.write("# enable: blk avg., fluct.")
-                f.write("\n" + "#" * 36 + "\n")
-
-            if len(obj.values) > 0:
-                if obj.multiline:
-                    for i in range(len(obj.values)):
-                        f.write(key.ljust(20) + " \t")
-                        f.write(str(obj) + "\n")
-                else:
-                    f.write(key.ljust(20) + " \t")
-                    f.write(str(obj) + "\n")
+    parts = ["#" * 30 + "\n",
+             "## Written by GOMC-wrapper \n",
+             f"## DATE: {now:%Y-%m-%d %H:%M:%S}\n",
+             "#" * 30 + "\n",
+             _section("INPUT")]
+    for key, obj in self.parameters.items():
+        if key in headings:
+            parts.append(headings[key])
+        parts.append(obj.render())
+
+    with open(self._path(filename), 'w') as f:
+        f.write("".join(parts))
 
 
 def write_topology(filename="topology.inp", atoms=['O', 'H', 'H', 'M'],
@@ -232,149 +253,212 @@ def write_parameter(filename="Par_TIP4P-2020_Charmm.inp", r0=0.9572,
         f.write(temp_nb.format(symbols['O'], 0.0, -epsilon, sigma/2, 0.0, 0.0, 0.0))
 
 
-def write_molecule(bonds, angles={}, filename="molecule.pdb", molname='TIP4P'):
-    """Write a PDB for a single molecule. Support molecules with two to
-    four atoms.
+def write_molecule(bonds, angles={}, filename="molecule.pdb", molname='TIP4P',
+                   dihedrals={}):
+    """Write a PDB for a single molecule, or a batch of molecules. The
+    geometry is built from internal coordinates, see build_molecules. Bond
+    lengths, angles and dihedrals might be given as arrays of length N, in
+    which case N PDB files are written, named by formatting 'filename' with
+    the candidate index (e.g. "molecule_{}.pdb") or given as a list.
 
-    - Diatomic molecules require one bond, no angle
-    - Triatomic molecules require two bonds, one angle
-    - Tetratomic molecules require three bonds, three angles
+    :returns: atom coordinates of shape (N, numatoms, 3)
+    :rtype: ndarray
     """
-    # collect all atoms
-    atoms = {}
-    for bondatoms in bonds.keys():
-        atom1, atom2 = bondatoms.split(",")
-        atoms[atom1] = None
-        atoms[atom2] = None
-    atoms = list(atoms.keys())
-    atoms_ordered = []
-
-    # place first atom in origin
-    coordinates = np.zeros((len(atoms), 3))
-
-    # place second atom along x-axis
-    first_bond = list(bonds.keys())[0]
-    coordinates[1, 0] = bonds[first_bond]
-    first_two_atoms = first_bond.split(",")
-    for first in first_two_atoms:
-        atoms_ordered.append(first)
-
-    if len(atoms) > 2:
-        # place third atom in the xy-plane
-        for angleatoms, angle in angles.items():
-            angle_atoms = angleatoms.split(",")
-            third_atom = angle_atoms.copy()
-            if atoms[0] in angle_atoms and atoms[1] in angle_atoms:
-                third_atom.remove(atoms[0])
-                third_atom.remove(atoms[1])
-                break
-
-        middle_atom = angle_atoms[1]
-        middle_index = atoms.index(middle_atom)
-
-        for bondatoms, bond in bonds.items():
-            bond_atoms = bondatoms.split(",")
-            if third_atom[0] in bond_atoms and middle_atom in bond_atoms:
-                break
-
-        x_middle = coordinates[middle_index, 0]
-        x_third = x_middle + np.sign(x_middle + 1e-6) * bond * np.cos(np.deg2rad(angle))
-        y_third = bond * np.sin(np.deg2rad(angle))
-
-        coordinates[2] = [x_third, y_third, 0]
-        atoms_ordered.append(third_atom[0])
-
-    if len(atoms) > 3:
-        # place fourth atom somewhere in the space that satisfies conditions
-        # restricted to the xy-plane
-        distributed_atom_indices = []
-        for atom in angle_atoms:
-            distributed_atom_indices.append(atoms.index(atom))
-
-        fourth_index = 6 - sum(distributed_atom_indices)
-        fourth_atom = atoms[fourth_index]
-        atoms_ordered.append(fourth_atom)
-
-        # find potential locations of the fourth particle
-        potential_points = []
-        for angleatoms, angle in angles.items():
-            angle_atoms = angleatoms.split(",")
-            if fourth_atom in angle_atoms:
-                assert fourth_atom != angle_atoms[1], "Circular bonding"
-                middle_atom = angle_atoms[1]
-                middle_index = atoms.index(middle_atom)
-
-                # find angle ordering
-                if fourth_atom == angle_atoms[0]:
-                    this_atom = angle_atoms[0]
-                    other_atom = angle_atoms[2]
-                    this_index = atoms.index(this_atom)
-                    other_index = atoms.index(other_atom)
-                else:
-                    other_atom = angle_atoms[0]
-                    this_atom = angle_atoms[2]
-                    other_index = atoms.index(other_atom)
-                    this_index = atoms.index(this_atom)
-
-                A = coordinates[middle_index]
-                B = coordinates[other_index]
-
-                # find bond length
-                for bondatoms, bondlength in bonds.items():
-                    bondatoms = bondatoms.split(",")
-                    if this_atom in bondatoms and middle_atom in bondatoms:
-                        break
-
-                # use simple trigonometric relations to find potential points
-                theta2 = np.arctan2(B[1] - A[1], B[0] - A[0])
-                phi1 = theta2 + np.deg2rad(angle)
-                phi2 = theta2 - np.deg2rad(angle)
-                p1 = [bondlength * np.cos(phi1), bondlength * np.sin(phi1)]
-                p2 = [bondlength * np.cos(phi2), bondlength * np.sin(phi2)]
-                potential_points.append([p1, p2])
-
-        # pick the correct coordinates of the fourth particle
-        for point1 in potential_points[0]:
-            for point2 in potential_points[1]:
-                if np.allclose(point1, point2):
-                    break
-        coordinates[3] = [point2[0], point2[1], 0]
-
-    if len(atoms) > 4:
-        raise AttributeError(
-            "Not able to construct molecules containing > 4 atoms")
+    labels, coordinates = build_molecules(bonds, angles, dihedrals)
+
+    if isinstance(filename, str):
+        if len(coordinates) > 1:
+            filenames = [filename.format(i) for i in range(len(coordinates))]
+            if len(set(filenames)) < len(filenames):
+                raise ValueError("Filename must contain '{}' to write a batch of molecules")
+        else:
+            filenames = [filename]
+    else:
+        filenames = list(filename)
 
     # write to file
-    temp = "ATOM   {:>4}  {:<4}{:<4}{:>4}{:>10.3f}{:>10.3f}{:>10.3f}{:>6.2f}{:>6.2f}\n"
+    temp = "ATOM  {:>5} {:<4} {:<4}{:>5}    {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}\n"
+    for name, coords in zip(filenames, coordinates):
+        with open(name, 'w') as f:
+            f.write("CRYST1    0.000    0.000    0.000  90.00  90.00  90.00 P 1          1\n")
+            for i, coord in enumerate(coords):
+                f.write(temp.format(i+1, labels[i], molname[:4], 1, coord[0], coord[1], coord[2], 0, 0))
+            f.write("END\n")
+    return coordinates
+
+
+def _write_packmol_input(filename, structures, tolerance, filetype, outfile,
+                         region=None, seed=None):
+    """Write Packmol input script. 'structures' is a list of (molecule
+    file, number of molecules) pairs, and 'region' is either the side of a
+    cube or the box (xmin, ymin, zmin, xmax, ymax, zmax) to pack into
+    """
     with open(filename, 'w') as f:
-        f.write("CRYST1    0.000    0.000    0.000  90.00  90.00  90.00 P 1          1\n")
-        for i, coord in enumerate(coordinates):
-            f.write(temp.format(i+1, atoms_ordered[i], molname[:4], 1, coord[0], coord[1], coord[2], 0, 0))
-        f.write("END\n")
+        f.write(f"tolerance {tolerance}\n")
+        f.write(f"filetype {filetype}\n")
+        if seed is not None:
+            f.write(f"seed {seed}\n")
+        f.write(f"output {outfile}\n")
+        for single_mol, nummol in structures:
+            if nummol == 0:
+                continue
+            f.write(f"\nstructure {single_mol}\n")
+            f.write(f"  number {nummol}\n")
+            if np.isscalar(region):
+                f.write(f"  inside cube 0. 0. 0. {region}\n")
+            else:
+                f.write("  inside box " + " ".join(f"{x:.6f}" for x in region) + "\n")
+            f.write("end structure\n")
+
+
+def _run_packmol(inputfile, cwd=None):
+    """Run Packmol on input script
+    """
+    if shutil.which("packmol") is None:
+        raise OSError("packmol is not found. For installation instructions, \
+                       see http://m3g.iqm.unicamp.br/packmol/download.shtml.")
+    with open(inputfile, 'r') as f:
+        subprocess.run(["packmol"], stdin=f, stdout=subprocess.DEVNULL,
+                       cwd=cwd, check=True)
+
+
+def _split_box(length, num_regions, gap):
+    """Split a cube of side 'length' into 'num_regions' boxes on a regular
+    grid. Neighboring boxes are separated by 'gap', while the outer faces
+    coincide with the cube
+    """
+    # find the grid with the most cubic regions
+    best = None
+    for nx in range(1, num_regions + 1):
+        for ny in range(1, num_regions // nx + 1):
+            nz = num_regions // (nx * ny)
+            if nx * ny * nz != num_regions:
+                continue
+            shape = sorted((nx, ny, nz))
+            if best is None or shape[2] - shape[0] < best[2] - best[0]:
+                best = shape
+    regions = []
+    for idx in np.ndindex(*best):
+        low = np.asarray(idx) * length / np.asarray(best)
+        high = (np.asarray(idx) + 1) * length / np.asarray(best)
+        low = np.where(np.asarray(idx) > 0, low + gap / 2, low)
+        high = np.where(np.asarray(idx) < np.asarray(best) - 1, high - gap / 2, high)
+        regions.append(np.concatenate((low, high)))
+    return regions
+
+
+def _write_pdb_parallel(structures, length, tolerance, outfile, num_procs,
+                        seed=None):
+    """Pack structures with one Packmol process per sub-region of the cube,
+    and merge the outputs into a single renumbered PDB file
+    """
+    regions = _split_box(length, num_procs, tolerance)
+    if seed is None:
+        seed = np.random.randint(1, 2**30)
+
+    # distribute the molecules of every structure evenly over the regions
+    counts = []
+    for single_mol, nummol in structures:
+        split = np.full(num_procs, nummol // num_procs)
+        split[:nummol % num_procs] += 1
+        counts.append(split)
+
+    tmpdir = tempfile.mkdtemp(prefix="packmol_", dir=os.path.dirname(os.path.abspath(outfile)))
+    try:
+        jobs = []
+        for i, region in enumerate(regions):
+            region_structures = [(os.path.abspath(single_mol), count[i])
+                                 for (single_mol, nummol), count in zip(structures, counts)]
+            inputfile = os.path.join(tmpdir, f"input_{i}.inp")
+            regionfile = os.path.join(tmpdir, f"out_{i}.pdb")
+            _write_packmol_input(inputfile, region_structures, tolerance,
+                                 'pdb', regionfile, region=region, seed=seed + i)
+            jobs.append((inputfile, regionfile))
+
+        # the Packmol processes run in parallel, the threads only wait for them
+        with ThreadPoolExecutor(max_workers=num_procs) as executor:
+            futures = [executor.submit(_run_packmol, inputfile, tmpdir)
+                       for inputfile, regionfile in jobs]
+            for future in futures:
+                future.result()
+
+        # merge regions and renumber atoms and molecules
+        merged = []
+        numres = 0
+        for inputfile, regionfile in jobs:
+            atoms = read_pdb(regionfile).atoms
+            if len(atoms) > 0:
+                resids = atoms['resid']
+                new = np.concatenate(([True], resids[1:] != resids[:-1]))
+                atoms['resid'] = numres + np.cumsum(new)
+                numres = atoms['resid'][-1]
+            merged.append(atoms)
+        merged = np.concatenate(merged)
+        merged['serial'] = np.arange(1, len(merged) + 1)
+        write_atoms(outfile, merged, cell=[length, length, length, 90, 90, 90])
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
 
 
 def write_pdb(nummol, length, single_mol, tolerance=2.0, filetype='pdb',
-              outfile=None):
-    """Write PDB file using Packmol
+              outfile=None, packer='packmol', seed=None, num_procs=1,
+              cwd=None):
+    """Write PDB file of 'nummol' copies of the molecule in 'single_mol'
+    packed in a cube of side 'length', using Packmol or the built-in NumPy
+    packer for rigid molecules. Several structures can be packed together
+    by giving lists of molecule counts and molecule files
+
+    :param nummol: number of molecules
+    :type nummol: int or list of int
+    :param single_mol: PDB file of a single molecule
+    :type single_mol: str or list of str
+    :param packer: 'packmol', or 'lattice' or 'random' to use the built-in
+        packer with molecules placed on a jittered lattice or at random
+        positions. 'random' is limited to low densities (well below liquid
+        water), see packer.pack
+    :type packer: str
+    :param seed: seed of random number generator
+    :type seed: int
+    :param num_procs: number of parallel Packmol processes. The cube is
+        split into this many sub-regions, separated by 'tolerance', which
+        are packed independently and merged
+    :type num_procs: int
+    :param cwd: directory that relative file names refer to and Packmol is
+        run in. Defaults to the current working directory
+    :type cwd: str
     """
     if outfile is None:
         outfile = "out." + filetype
-    with open("input.inp", 'w') as f:
-        f.write(f"tolerance {tolerance}\n")
-        f.write(f"filetype {filetype}\n")
-        f.write(f"output {outfile}\n\n")
-        f.write(f"structure {single_mol}\n")
-        f.write(f"  number {nummol}\n")
-        f.write(f"  inside cube 0. 0. 0. {length}\n")
-        f.write("end structure")
-
-    # Run packmol input script
-    try:
-        os.system("packmol < input.inp")
-        # subprocess.run(["packmol", "<", "input.inp"])
-    except:
-        raise OSError("packmol is not found. For installation instructions, \
-                       see http://m3g.iqm.unicamp.br/packmol/download.shtml.")
+    if isinstance(single_mol, str):
+        single_mol, nummol = [single_mol], [nummol]
+    if cwd is not None:
+        outfile = os.path.abspath(os.path.join(cwd, outfile))
+        single_mol = [os.path.abspath(os.path.join(cwd, mol)) for mol in single_mol]
+    structures = [(mol, int(num)) for mol, num in zip(single_mol, nummol)]
+
+    if packer in ('lattice', 'random'):
+        if filetype != 'pdb':
+            raise NotImplementedError(f"Filetype {filetype} is not supported")
+        if len(structures) != 1:
+            raise NotImplementedError("The built-in packer supports a single structure")
+        pack_pdb(structures[0][1], length, structures[0][0],
+                 tolerance=tolerance, outfile=outfile, method=packer, seed=seed)
+        return
+    elif packer != 'packmol':
+        raise NotImplementedError(f"Packer {packer} is not supported")
+
+    if num_procs > 1:
+        if filetype != 'pdb':
+            raise NotImplementedError(f"Filetype {filetype} is not supported")
+        _write_pdb_parallel(structures, length, tolerance, outfile, num_procs,
+                            seed=seed)
+        return
+
+    # Run packmol input script, named after the output file
+    inputfile = os.path.splitext(outfile)[0] + "_packmol.inp"
+    _write_packmol_input(inputfile, structures, tolerance, filetype, outfile,
+                         region=length, seed=seed)
+    _run_packmol(inputfile, cwd=cwd)
 
 
 def write_jobscript(filename, executable, slurm_args={}):
@@ -389,98 +473,104 @@ def write_jobscript(filename, executable, slurm_args={}):
         f.write(string)
 
 
-def psfgen(coordinates="coord.pdb", topology="topology.inp", genfile=None):
-    """Generate PSF file
+def _tile_template(template, offsets):
+    """Repeat a per-molecule array of connected atoms (bonds, angles etc.)
+    given as zero-based local indices over all molecules starting at
+    'offsets'. Returns an integer array of shape
+    (len(offsets) * len(template), template.shape[1]) with 1-based atom
+    indices
+    """
+    tiled = template[np.newaxis, :, :] + offsets[:, np.newaxis, np.newaxis] + 1
+    return tiled.reshape(-1, template.shape[1])
+
+
+def _iter_offsets(nummols, mols_per_chunk, atoms_per_mol):
+    """Iterate over the atom offsets of all molecules in chunks of at most
+    'mols_per_chunk' molecules
+    """
+    for start in range(0, nummols, mols_per_chunk):
+        stop = min(start + mols_per_chunk, nummols)
+        yield np.arange(start, stop) * atoms_per_mol
+
+
+def _write_columns(f, values, numcol):
+    """Write integer values to PSF file with 'numcol' values per line. The
+    last line is allowed to be incomplete
     """
+    values = np.asarray(values, dtype=int).ravel()
+    numfull = len(values) // numcol * numcol
+    np.savetxt(f, values[:numfull].reshape(-1, numcol), fmt=numcol * '%8d')
+    if numfull < len(values):
+        np.savetxt(f, values[numfull:].reshape(1, -1),
+                   fmt=(len(values) - numfull) * '%8d')
+
+
+def psfgen(coordinates="coord.pdb", topology="topology.inp", genfile=None,
+           chunksize=None, resname=None):
+    """Generate PSF file
 
-    # read coordinate file
-    with open(coordinates, 'r') as f:
-        f.readline()
-        title = f.readline()
-        line = f.readline()
-        while line.startswith("REMARK"):
-            line = f.readline()
-        columns = "TYPE ATOM_ID ATOM_LABEL MOL_LABEL MOL_ID X Y Z \
-                   MASS CHARGE ATOM_TYPE\n"
-        full_string = columns + line + f.read()[:-6]
-        df = pd.read_table(StringIO(full_string), sep=r'\s+')
-    numatoms = df['ATOM_ID'].iloc[-1]
-    nummols = df['MOL_ID'].iloc[-1]
-
-    # read topology file
-    autogenerate = []
-    atom_types = []
-    atom_masses = []
-    atoms = []
-    atom_labels = []
-    atom_charges = []
-    bonds = []
-    with open(topology, 'r') as f:
-        for line in f:
-            splitted = line.split()
-            if line.startswith("MASS "):
-                atom_types.append(splitted[2])
-                atom_masses.append(splitted[3])
-            elif line.startswith("DEFA "):
-                first = splitted[2]
-                last = splitted[4]
-            elif line.startswith("AUTOGENERATE "):
-                for i in range(1, len(splitted)):
-                    autogenerate.append(splitted[i])
-            elif line.startswith("RESI "):
-                mollabel = splitted[1]
-            elif line.startswith("ATOM "):
-                atom_labels.append(splitted[1])
-                atoms.append(splitted[2])
-                atom_charges.append(splitted[3])
-            elif line.startswith("BOND "):
-                for i in range((len(splitted)-1)//2):
-                    bonds.append([splitted[2*i+1], splitted[2*i+2]])
+    :param coordinates: PDB file containing the molecules
+    :type coordinates: str
+    :param topology: CHARMM topology file of the molecule
+    :type topology: str
+    :param genfile: name of generated PSF file
+    :type genfile: str
+    :param chunksize: stream the coordinate file and the PSF sections in
+        chunks of approximately this many atoms, such that the peak memory
+        is bounded regardless of system size. By default, all atoms are
+        processed at once
+    :type chunksize: int
+    :param resname: residue in topology file to use. Only required if the
+        topology file contains several residues
+    :type resname: str
+    """
+    # read (compiled) topology file
+    topo = compile_topology(topology)
+    residue = topo.residue(resname)
 
     # create filename of not given
     if genfile is None:
-        name, extention = coordinates.split('.')
+        name, extention = os.path.splitext(coordinates)
         genfile = name + ".psf"
 
-    # structurate information to be used in PSF file
-    charges, masses = {}, {}
-    for atom, charge in zip(atoms, atom_charges):
-        charges[atom] = charge
-    for atom, mass in zip(atom_types, atom_masses):
-        masses[atom] = mass
-
-    df['ISB'] = numatoms * ["ISB"]
-    df['ZEROS'] = numatoms * [0]
-    all_atom_ids = df['ATOM_LABEL']
-    all_charges = df['ATOM_LABEL']
-    all_masses = df['ATOM_LABEL']
-    for atom, label in zip(atoms, atom_labels):
-        all_atom_ids = np.where(all_atom_ids == label, atom, all_atom_ids)
-        all_charges = np.where(all_atom_ids == atom, charges[atom], all_charges)
-        all_masses = np.where(all_atom_ids == atom, masses[atom], all_masses)
-
-    df['ATOM_TYPE_TOPO'] = all_atom_ids
-    df['CHARGE'] = np.asarray(all_charges, dtype=float)
-    df['MASS'] = np.asarray(all_masses, dtype=float)
-    df['MOL_LABEL_TOPO'] = numatoms * [mollabel]
-
-    # generate bond and angle lists
-    angles = [['H1', 'O1', 'M1'], ['H1', 'O1', 'H2'], ['H2', 'O1', 'M1']]
+    # chunks are aligned to whole molecules, and the number of molecules per
+    # chunk is a multiple of 36 such that every bond (6 columns), angle (9
+    # columns), dihedral (8 columns) and non-bonded (4 columns) line is
+    # complete within a chunk
+    atoms_per_mol = residue.numatoms
+    numatoms = count_atoms(coordinates)
+    nummols = numatoms // atoms_per_mol
+    if atoms_per_mol * nummols != numatoms:
+        raise ValueError("All molecules need to have the same number of atoms")
+    if chunksize is None:
+        mols_per_chunk = max(nummols, 1)
+    else:
+        mols_per_chunk = max(chunksize // atoms_per_mol // 36, 1) * 36
+    atoms_per_chunk = mols_per_chunk * atoms_per_mol
+
+    # map the residue template onto the atom ordering of the first
+    # molecule, and check that every other molecule follows the same order
+    chunks = iter_pdb(coordinates, atoms_per_chunk)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        raise ValueError(f"No atoms found in {coordinates}")
+    mol_labels = first_chunk['name'][:atoms_per_mol]
+    label_to_index = {label: i for i, label in enumerate(mol_labels)}
+    try:
+        order = np.asarray([label_to_index[label] for label in residue.labels])
+    except KeyError as e:
+        raise ValueError(f"Atom {e} of residue {residue.name} not found in "
+                         f"{coordinates}")
+    inverse = np.argsort(order)
+    mol_types = residue.types[inverse]
+    mol_charges = residue.charges[inverse]
+    mol_masses = residue.masses[inverse]
+    bonds = order[residue.bonds]
+    angles = order[residue.angles]
+    dihedrals = order[residue.dihedrals]
     numbonds = nummols * len(bonds)
     numangles = nummols * len(angles)
-    bond_list = []
-    angle_list = []
-    for mol in range(nummols):
-        mol_atoms = {}
-        for atom in np.where(df['MOL_ID'] == mol + 1)[0]:
-            mol_atoms[df['ATOM_LABEL'].iloc[atom]] = atom + 1
-        for bond in bonds:
-            bond_list.append(mol_atoms[bond[0]])
-            bond_list.append(mol_atoms[bond[1]])
-        for angle in angles:
-            angle_list.append(mol_atoms[angle[0]])
-            angle_list.append(mol_atoms[angle[1]])
-            angle_list.append(mol_atoms[angle[2]])
+    numdihedrals = nummols * len(dihedrals)
 
     # write PSF file
     now = datetime.datetime.now()
@@ -493,37 +583,53 @@ def psfgen(coordinates="coord.pdb", topology="topology.inp", genfile=None):
         f.write(temp.format("REMARKS", f"DATE: {now:%Y-%m-%d %H:%M:%S}"))
         f.write(temp.format("REMARKS", f"topology {topology}"))
         string = "segment ISB {"
-        string += " first " + first + ";"
-        string += " last " + last + ";"
+        string += " first " + topo.first + ";"
+        string += " last " + topo.last + ";"
         string += " auto"
-        for auto in autogenerate:
+        for auto in topo.autogenerate:
             string += " " + auto.lower()
         string += " }\n"
         f.write(temp.format("REMARKS", string))
 
         # write atom information
         f.write(temp.format(numatoms, "!NATOM"))
-        df_as = df[['ATOM_ID', 'ISB', 'MOL_ID', 'MOL_LABEL_TOPO', 'ATOM_LABEL',
-                    'ATOM_TYPE_TOPO', 'CHARGE', 'MASS', 'ZEROS']].copy()
-        np.savetxt(f, df_as.values, fmt='%8d %-4s %-4d %-4s %-4s %-4s %10.6f %13.4f %11d')
+        offset = 0
+        for atoms in itertools.chain([first_chunk], chunks):
+            nummols_chunk = len(atoms) // atoms_per_mol
+            if not np.array_equal(atoms['name'], np.tile(mol_labels, nummols_chunk)):
+                raise ValueError("All molecules need to have the same atom ordering")
+            rows = np.empty((len(atoms), 9), dtype=object)
+            rows[:, 0] = atoms['serial']
+            rows[:, 1] = "ISB"
+            # residue IDs follow from the atom index, as IDs beyond 9999 do
+            # not fit the PDB column
+            rows[:, 2] = (offset + np.arange(len(atoms))) // atoms_per_mol + 1
+            offset += len(atoms)
+            rows[:, 3] = residue.name
+            rows[:, 4] = atoms['name']
+            rows[:, 5] = np.tile(mol_types, nummols_chunk)
+            rows[:, 6] = np.tile(mol_charges, nummols_chunk)
+            rows[:, 7] = np.tile(mol_masses, nummols_chunk)
+            rows[:, 8] = 0
+            np.savetxt(f, rows, fmt='%8d %-4s %-4d %-4s %-4s %-4s %10.6f %13.4f %11d')
 
         # write bond information
-        numcol = 6
         f.write("\n")
         f.write(temp.format(numbonds, "!NBOND: bonds"))
-        bonds = np.asarray(bond_list, dtype=int).reshape(-1, numcol)
-        np.savetxt(f, bonds, fmt=numcol * '%8d')
+        for offsets in _iter_offsets(nummols, mols_per_chunk, atoms_per_mol):
+            _write_columns(f, _tile_template(bonds, offsets), numcol=6)
 
         # write angle information
-        numcol = 9
         f.write("\n")
         f.write(temp.format(numangles, "!NTHETA: angles"))
-        angles = np.asarray(angle_list, dtype=int).reshape(-1, numcol)
-        np.savetxt(f, angles, fmt=numcol * '%8d')
+        for offsets in _iter_offsets(nummols, mols_per_chunk, atoms_per_mol):
+            _write_columns(f, _tile_template(angles, offsets), numcol=9)
 
         # write dihedral information
         f.write("\n")
-        f.write(temp.format(0, "!NPHI: dihedrals"))
+        f.write(temp.format(numdihedrals, "!NPHI: dihedrals"))
+        for offsets in _iter_offsets(nummols, mols_per_chunk, atoms_per_mol):
+            _write_columns(f, _tile_template(dihedrals, offsets), numcol=8)
 
         # write improper information
         f.write("\n\n")
@@ -541,10 +647,9 @@ def psfgen(coordinates="coord.pdb", topology="topology.inp", genfile=None):
         f.write("\n\n")
         f.write(temp.format(0, "!NNB: non-bonded"))
         f.write("\n")
-        zeros = np.zeros(numatoms)
-        numcol = 4
-        zeros = zeros.reshape(-1, numcol)
-        np.savetxt(f, zeros, fmt=numcol * '%8d')
+        for start in range(0, numatoms, atoms_per_chunk):
+            numzeros = min(atoms_per_chunk, numatoms - start)
+            _write_columns(f, np.zeros(numzeros, dtype=int), numcol=4)
 
         # write acceptors information
         f.write("\n")
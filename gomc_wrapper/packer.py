@@ -0,0 +1,323 @@
+import numpy as np
+from .pdbfile import ATOM_DTYPE, read_pdb, write_atoms
+
+
+class _CellList:
+    """Cell list of atoms in a non-periodic cubic box, used to check that
+    atoms of different molecules are separated by at least 'cutoff'. The
+    atoms are stored sorted by cell, with the atoms of cell i found at
+    positions start[i]:start[i+1] of the sorted arrays
+    """
+    def __init__(self, length, cutoff):
+        self.cutoff = cutoff
+        self.numcells = max(int(length // cutoff), 1)
+        self.cellsize = length / self.numcells
+        self.positions = np.zeros((0, 3))
+        self.owners = np.zeros(0, dtype=np.int64)
+        offsets = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1],
+                                       indexing='ij'), axis=-1)
+        self.offsets = offsets.reshape(-1, 3)
+        self._sort()
+
+    def _cell_index(self, positions):
+        idx = np.floor(positions / self.cellsize).astype(np.int64)
+        return np.clip(idx, 0, self.numcells - 1)
+
+    def _flatten(self, idx):
+        # cells outside the box are mapped to an extra, empty cell
+        n = self.numcells
+        flat = (idx[..., 0] * n + idx[..., 1]) * n + idx[..., 2]
+        outside = np.any((idx < 0) | (idx >= n), axis=-1)
+        return np.where(outside, n**3, flat)
+
+    def _sort(self):
+        cells = self._flatten(self._cell_index(self.positions))
+        order = np.argsort(cells, kind='stable')
+        self.sorted_positions = self.positions[order]
+        self.sorted_owners = self.owners[order]
+        self.start = np.searchsorted(cells[order], np.arange(self.numcells**3 + 2))
+
+    def add(self, positions, owners):
+        """Add atoms to the cell list
+        """
+        self.positions = np.concatenate((self.positions, positions))
+        self.owners = np.concatenate((self.owners, owners))
+        self._sort()
+
+    def pairs(self, positions, owners):
+        """Find all pairs of query positions and stored atoms of other owners
+        that are closer than the cutoff. Returns the query indices and the
+        owners of the stored atoms
+        """
+        idx = self._cell_index(positions)
+        neighbors = self._flatten(idx[:, np.newaxis, :] + self.offsets).ravel()
+        first = self.start[neighbors]
+        counts = self.start[neighbors + 1] - first
+        total = counts.sum()
+        if total == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        cumulative = np.cumsum(counts) - counts
+        stored = (np.arange(total) - np.repeat(cumulative - first, counts))
+        query = np.repeat(np.arange(len(neighbors)) // len(self.offsets), counts)
+        dist2 = np.sum((self.sorted_positions[stored] - positions[query])**2,
+                       axis=1)
+        other = self.sorted_owners[stored]
+        hit = (dist2 < self.cutoff**2) & (other != owners[query])
+        return query[hit], other[hit]
+
+    def count(self, positions, owners):
+        """Count the stored atoms of other owners that are closer than the
+        cutoff to each position
+        """
+        query, other = self.pairs(positions, owners)
+        return np.bincount(query, minlength=len(positions))
+
+    def conflicts(self, positions, owners):
+        """Find the lowest owner among stored atoms of other owners that are
+        closer than the cutoff to each position. Returns -1 where there is
+        no conflict
+        """
+        query, other = self.pairs(positions, owners)
+        large = np.iinfo(np.int64).max
+        lowest = np.full(len(positions), large, dtype=np.int64)
+        np.minimum.at(lowest, query, other)
+        return np.where(lowest == large, -1, lowest)
+
+
+def random_rotations(num, rng):
+    """Generate 'num' uniformly distributed random rotation matrices
+    """
+    u1, u2, u3 = rng.random((3, num))
+    q = np.stack((np.sqrt(1 - u1) * np.sin(2 * np.pi * u2),
+                  np.sqrt(1 - u1) * np.cos(2 * np.pi * u2),
+                  np.sqrt(u1) * np.sin(2 * np.pi * u3),
+                  np.sqrt(u1) * np.cos(2 * np.pi * u3)), axis=1)
+    x, y, z, w = q.T
+    return np.stack((
+        np.stack((1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)), axis=1),
+        np.stack((2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)), axis=1),
+        np.stack((2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)), axis=1)),
+        axis=1)
+
+
+# packing fraction above which random insertion jams (random sequential
+# addition of spheres jams at about 0.38)
+RANDOM_PACKING_LIMIT = 0.3
+
+
+def _atom_volume(molecule, tolerance, numpoints=20000):
+    """Monte Carlo estimate of the volume of the union of spheres of
+    diameter 'tolerance' around the atoms of a molecule
+    """
+    radius = tolerance / 2
+    low = molecule.min(axis=0) - radius
+    high = molecule.max(axis=0) + radius
+    points = np.random.default_rng(0).uniform(low, high, (numpoints, 3))
+    inside = np.zeros(numpoints, dtype=bool)
+    for atom in molecule:
+        inside |= np.sum((points - atom)**2, axis=1) < radius**2
+    return np.prod(high - low) * np.mean(inside)
+
+
+def pack(molecule, nummol, length, tolerance=2.0, method='lattice',
+         seed=None, batchsize=4096, maxtrials=1000):
+    """Pack rigid copies of a molecule in a cube [0, length]^3, such that
+    atoms of different molecules are separated by at least 'tolerance'.
+    Molecules are randomly rotated and placed on a jittered lattice
+    ('lattice') or at random positions ('random'). Molecules are processed
+    in batches, and rejected molecules are retried with new rotations (and
+    positions) until all molecules are placed.
+
+    Random insertion jams at low densities: it is limited to a packing
+    fraction of RANDOM_PACKING_LIMIT, i.e. the volume of the atoms (spheres
+    of diameter 'tolerance') relative to the volume available to the
+    molecule centers. Liquid densities are beyond this limit, and a
+    ValueError is raised up front for them. Use 'lattice' instead.
+
+    :param molecule: atom coordinates of a single molecule, shape (n, 3)
+    :type molecule: ndarray
+    :param nummol: number of molecules
+    :type nummol: int
+    :param length: box length
+    :type length: float
+    :param tolerance: minimum distance between atoms of different molecules
+    :type tolerance: float
+    :param method: 'lattice' or 'random'
+    :type method: str
+    :param seed: seed of random number generator
+    :type seed: int
+    :param batchsize: number of molecules to insert at a time
+    :type batchsize: int
+    :param maxtrials: maximum number of trials per molecule
+    :type maxtrials: int
+    :returns: atom coordinates of shape (nummol, n, 3)
+    :rtype: ndarray
+    """
+    rng = np.random.default_rng(seed)
+    molecule = np.asarray(molecule, dtype=float)
+    molecule = molecule - molecule.mean(axis=0)
+    radius = np.max(np.linalg.norm(molecule, axis=1))
+    low, high = radius, length - radius
+    if high < low:
+        raise ValueError("Box is too small to contain a single molecule")
+    if method == 'random':
+        fraction = nummol * _atom_volume(molecule, tolerance) \
+            / max(high - low, tolerance)**3
+        if fraction > RANDOM_PACKING_LIMIT:
+            raise ValueError(f"Packing fraction {fraction:.2f} is too high for "
+                             "random insertion (limit "
+                             f"{RANDOM_PACKING_LIMIT}), use method 'lattice'")
+
+    def place(centers):
+        rotations = random_rotations(len(centers), rng)
+        return centers[:, np.newaxis, :] + np.einsum('bij,aj->bai', rotations,
+                                                     molecule)
+
+    if method == 'lattice':
+        return _pack_lattice(place, molecule, nummol, low, high, tolerance,
+                             length, rng, maxtrials)
+    elif method == 'random':
+        return _pack_random(place, molecule, nummol, low, high, tolerance,
+                            length, rng, batchsize, maxtrials)
+    raise NotImplementedError(f"Packing method {method} is not supported")
+
+
+def _pack_lattice(place, molecule, nummol, low, high, tolerance, length, rng,
+                  maxtrials):
+    """Place all molecules on a jittered lattice at once, and re-draw the
+    rotations and jitter of overlapping molecules until there are no
+    overlaps (min-conflicts search)
+    """
+    numatoms = len(molecule)
+    radius = np.max(np.linalg.norm(molecule, axis=1))
+    numside = int(np.ceil(nummol**(1/3) - 1e-9))
+    # the outermost sites touch the walls, where molecules only have
+    # neighbors on one side
+    spacing = (high - low) / max(numside - 1, 1)
+    grid = np.stack(np.meshgrid(*3 * [np.arange(numside)], indexing='ij'),
+                    axis=-1).reshape(-1, 3)
+    sites = low + grid[rng.permutation(len(grid))[:nummol]] * spacing
+    # jitter by the free space between molecules, but at least by a small
+    # fraction of the spacing to let overlapping molecules escape
+    jitter = max(spacing - 2 * radius - tolerance, 0.2 * spacing) / 2
+
+    def jittered(idx):
+        centers = sites[idx] + rng.uniform(-jitter, jitter, (len(idx), 3))
+        return np.clip(centers, low, high)
+
+    packed = place(jittered(np.arange(nummol)))
+    owners = np.repeat(np.arange(nummol), numatoms)
+    check = np.arange(nummol)
+    for trial in range(maxtrials):
+        cells = _CellList(length, tolerance)
+        cells.add(packed.reshape(-1, 3), owners)
+
+        # only molecules that overlapped, or that are close to a molecule
+        # that was moved, in the previous iteration can overlap now
+        current = cells.count(packed[check].reshape(-1, 3),
+                              np.repeat(check, numatoms))
+        current = current.reshape(len(check), -1).sum(axis=1)
+        redraw = check[current > 0]
+        current = current[current > 0]
+        if len(redraw) == 0:
+            return packed
+
+        # propose new positions and rotations for every overlapping molecule
+        # (several when there are few of them), and accept the best proposal
+        # if it does not increase the number of overlaps
+        numproposals = int(np.clip(4096 // len(redraw), 1, 32))
+        proposed = place(jittered(np.repeat(redraw, numproposals)))
+        query, other = cells.pairs(proposed.reshape(-1, 3),
+                                   np.repeat(redraw, numproposals * numatoms))
+        overlaps = np.bincount(query // numatoms, minlength=len(proposed))
+        overlaps = overlaps.reshape(len(redraw), numproposals)
+        best = np.argmin(overlaps, axis=1)
+        accepted = overlaps[np.arange(len(redraw)), best] <= current
+        chosen = np.arange(len(redraw)) * numproposals + best
+        packed[redraw[accepted]] = proposed[chosen[accepted]]
+
+        moved = np.isin(query // numatoms, chosen[accepted])
+        check = np.union1d(redraw, other[moved])
+    raise RuntimeError("Could not pack molecules without overlaps. Try a "
+                       "lower tolerance or density, or use Packmol")
+
+
+def _pack_random(place, molecule, nummol, low, high, tolerance, length, rng,
+                 batchsize, maxtrials):
+    """Insert molecules at random positions in batches, rejecting molecules
+    that overlap with already inserted molecules or with an earlier
+    molecule in the same batch. Rejected molecules are retried
+    """
+    numatoms = len(molecule)
+    cells = _CellList(length, tolerance)
+    packed = np.empty((nummol, numatoms, 3))
+    trials = np.zeros(nummol, dtype=np.int64)
+    pending = np.arange(nummol)
+    while len(pending) > 0:
+        batch = pending[:batchsize]
+        atoms = place(rng.uniform(low, high, (len(batch), 3)))
+        positions = atoms.reshape(-1, 3)
+        owners = np.repeat(batch, numatoms)
+
+        # reject molecules overlapping with already placed molecules
+        accepted = ~np.any((cells.conflicts(positions, owners) >= 0)
+                           .reshape(len(batch), -1), axis=1)
+
+        # reject molecules overlapping with an earlier molecule in the batch
+        local = _CellList(length, tolerance)
+        mask = np.repeat(accepted, numatoms)
+        local.add(positions[mask], owners[mask])
+        lowest = local.conflicts(positions[mask], owners[mask])
+        earlier = (lowest >= 0) & (lowest < owners[mask])
+        accepted[accepted] = ~np.any(earlier.reshape(-1, numatoms), axis=1)
+
+        mask = np.repeat(accepted, numatoms)
+        cells.add(positions[mask], owners[mask])
+        packed[batch[accepted]] = atoms[accepted]
+
+        rejected = batch[~accepted]
+        trials[rejected] += 1
+        if np.any(trials[rejected] >= maxtrials):
+            raise RuntimeError("Could not pack molecules without overlaps. "
+                               "Try a lower tolerance or density, or use "
+                               "Packmol")
+        pending = np.concatenate((pending[batchsize:], rejected))
+    return packed
+
+
+def write_packed_pdb(filename, names, resname, packed, length=None):
+    """Write packed molecules to a PDB file
+
+    :param filename: output PDB file
+    :type filename: str
+    :param names: atom names of a single molecule
+    :type names: list of str
+    :param resname: residue name
+    :type resname: str
+    :param packed: atom coordinates of shape (nummol, n, 3)
+    :type packed: ndarray
+    :param length: box length written to the CRYST1 record
+    :type length: float
+    """
+    nummol, numatoms = packed.shape[:2]
+    atoms = np.zeros(nummol * numatoms, dtype=ATOM_DTYPE)
+    atoms['serial'] = np.arange(1, nummol * numatoms + 1)
+    atoms['resid'] = np.repeat(np.arange(1, nummol + 1), numatoms)
+    atoms['name'] = np.tile(np.asarray(names, dtype=str), nummol)
+    atoms['resname'] = resname
+    atoms['coordinates'] = packed.reshape(-1, 3)
+    atoms['occupancy'] = 1.0
+    cell = None if length is None else [length, length, length, 90, 90, 90]
+    write_atoms(filename, atoms, cell=cell)
+
+
+def pack_pdb(nummol, length, single_mol, tolerance=2.0, outfile="out.pdb",
+             method='lattice', seed=None):
+    """Pack copies of the molecule in PDB file 'single_mol' in a cube of
+    side 'length' and write the result to 'outfile'
+    """
+    pdb = read_pdb(single_mol)
+    packed = pack(pdb.coordinates, nummol, length, tolerance=tolerance,
+                  method=method, seed=seed)
+    resname = pdb.atoms['resname'][0] if len(pdb) > 0 else "MOL"
+    write_packed_pdb(outfile, pdb.names, resname, packed, length=length)
@@ -1,16 +1,155 @@
+from types import MappingProxyType
+from collections import namedtuple
+from collections.abc import Mapping
+
+# immutable schema entry of a GOMC keyword, shared by all GOMC objects
+Keyword = namedtuple("Keyword", ["name", "types", "multiline", "repeat_last"])
+
+_schema = {}
+
+
+def _register(name, *types, multiline=False, repeat_last=False):
+    _schema[name] = Keyword(name, types, multiline, repeat_last)
+
+
+_register("Restart", bool)
+_register("RestartCheckpoint", bool)
+_register("PRNG", str)
+_register("Random_Seed", int)
+_register("ParaTypeCHARMM", bool)
+_register("ParaTypeEXOTIC", bool)
+_register("ParaTypeMie", bool)
+_register("ParaTypeMARTINI", bool)
+_register("Parameters", str)
+_register("Coordinates", int, str, multiline=True)
+_register("Structure", int, str, multiline=True)
+_register("Structures", int, str, multiline=True)
+_register("MultiSimFolderName", str)
+_register("GEMC", str)
+_register("Pressure", float)
+_register("Temperature", float, float, float, float, float)
+_register("Rcut", float)
+_register("RcutLow", float)
+_register("RcutCoulomb", int, float, multiline=True)
+_register("LRC", bool)
+_register("Exclude", str)
+_register("Potential", str)
+_register("Rswitch", float)
+_register("VDWGeometricSigma", bool)
+_register("ElectroStatic", bool)
+_register("Ewald", bool)
+_register("CachedFourier", bool)
+_register("Tolerance", float)
+_register("Dielectric", float)
+_register("PressureCalc", bool, int)
+_register("1-4scaling", float)
+_register("RunSteps", int)
+_register("EqSteps", int)
+_register("AdjSteps", int)
+_register("ChemPot", str, float)
+_register("Fugacity", str, float)
+_register("DisFreq", float)
+_register("RotFreq", float)
+_register("IntraSwapFreq", float)
+_register("RegrowthFreq", float)
+_register("CrankShaftFreq", float)
+_register("MultiParticleFreq", float)
+_register("IntraMEMC-1Freq", float)
+_register("IntraMEMC-2Freq", float)
+_register("IntraMEMC-3Freq", float)
+_register("MEMC-1Freq", float)
+_register("MEMC-2Freq", float)
+_register("MEMC-3Freq", float)
+_register("SwapFreq", float)
+_register("VolFreq", float)
+_register("ExchangeVolumeDim", float, float, float)
+_register("ExchangeSmallKind", float)
+_register("ExchangeLargeKind", float)
+_register("ExchangeRatio", int)
+_register("LargeKindBackBone", str, str)
+_register("SmallKindBackBone", str, str)
+_register("useConstantArea", bool)
+_register("FixVolBox0", bool)
+_register("CellBasisVector1", int, float, float, float, multiline=True)
+_register("CellBasisVector2", int, float, float, float, multiline=True)
+_register("CellBasisVector3", int, float, float, float, multiline=True)
+_register("CBMC_First", int)
+_register("CBMC_Nth", int)
+_register("CBMC_Ang", int)
+_register("CBMC_Dih", int)
+_register("FreeEnergyCalc", bool, int, repeat_last=True)
+_register("MoleculeType", str, int)
+_register("InitialState", int)
+_register("LambdaVDW", float, repeat_last=True)
+_register("LambdaCoulomb", float, repeat_last=True)
+_register("ScaleCoulomb", bool)
+_register("ScalePower", int)
+_register("ScaleAlpha", float)
+_register("MinSigma", float)
+_register("OutputName", str)
+_register("CoordinatesFreq", bool, int)
+_register("RestartFreq", bool, int)
+_register("CheckpointFreq", bool, int)
+_register("ConsoleFreq", bool, int)
+_register("BlockAverageFreq", bool, int)
+_register("HistogramFreq", bool, int)
+_register("DistName", str)
+_register("HistName", str)
+_register("RunNumber", int)
+_register("RunLetter", str)
+_register("SampleFreq", int)
+_register("OutEnergy", bool, bool)
+_register("OutPressure", bool, bool)
+_register("OutMolNum", bool, bool)
+_register("OutDensity", bool, bool)
+_register("OutVolume", bool, bool)
+_register("OutSurfaceTension", bool, bool)
+_register("OutHeat", bool, bool)
+
+
+# registry of all possible keywords, in the order they are written
+SCHEMA = MappingProxyType(_schema)
+
+
 class Parameter:
-    def __init__(self, *types, multiline=False, repeat_last=False):
-        self.types = types
-        self.multiline = multiline
-        self.repeat_last = repeat_last
-        if multiline:
+    """Value(s) of a single keyword. The keyword schema is shared, such
+    that a parameter only stores its values (and its types if they were
+    extended by a repeat_last keyword). The rendered config lines are
+    cached until the parameter is set again
+    """
+    __slots__ = ("keyword", "types", "values", "_rendered")
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+        self.types = keyword.types
+        if keyword.multiline:
             self.values = {}
         else:
             self.values = []
-        self.numprinted = 0
+        self._rendered = None
 
     def __repr__(self):
-        return ', '.join(self.types)
+        return ', '.join(thistype.__name__ for thistype in self.types)
+
+    @property
+    def multiline(self):
+        return self.keyword.multiline
+
+    @property
+    def repeat_last(self):
+        return self.keyword.repeat_last
+
+    def copy(self):
+        """Copy of the parameter, sharing the keyword schema
+        """
+        other = Parameter(self.keyword)
+        other.types = self.types
+        if self.multiline:
+            other.values = dict(self.values)
+        else:
+            other.values = list(self.values)
+        other._rendered = self._rendered
+        return other
 
     @staticmethod
     def print_style(values, types):
@@ -39,14 +178,28 @@ class Parameter:
 
     def __str__(self):
         if self.multiline:
-            values = list(self.values.values())[self.numprinted]
-            string = self.print_style(values, self.types)
-            self.numprinted += 1
-        else:
-            string = self.print_style(self.values, self.types)
-        return string
+            return "\n".join(self.print_style(values, self.types)
+                             for values in self.values.values())
+        return self.print_style(self.values, self.types)
+
+    def render(self):
+        """Config file lines of the parameter, one line per box for
+        multiline keywords. Empty if the parameter is not set
+        """
+        if self._rendered is None:
+            if self.multiline:
+                lines = self.values.values()
+            elif len(self.values) > 0:
+                lines = [self.values]
+            else:
+                lines = []
+            prefix = self.keyword.name.ljust(20) + " \t"
+            self._rendered = "".join(prefix + self.print_style(values, self.types) + "\n"
+                                     for values in lines)
+        return self._rendered
 
     def set(self, *values):
+        self._rendered = None
         if self.repeat_last:
             # give types dynamic length
             types = [self.types[-1] for _ in range(len(values))]
@@ -71,106 +224,77 @@ class Parameter:
                 self.values.append(thistype(value))
 
 
+class Parameters(Mapping):
+    """Values of all the GOMC keywords. Only keywords that have been
+    accessed are stored, and clones share their parameters until either
+    side accesses them for modification (copy-on-write)
+    """
+    __slots__ = ("_parameters", "_owned")
+
+    def __init__(self):
+        self._parameters = {}
+        self._owned = set()
+
+    def __getitem__(self, keyword):
+        """Get parameter of 'keyword' for modification
+        """
+        if keyword not in self._owned:
+            parameter = self._parameters.get(keyword)
+            if parameter is None:
+                parameter = Parameter(SCHEMA[keyword])
+            else:
+                parameter = parameter.copy()
+            self._parameters[keyword] = parameter
+            self._owned.add(keyword)
+        return self._parameters[keyword]
+
+    def __iter__(self):
+        return iter(SCHEMA)
+
+    def __len__(self):
+        return len(SCHEMA)
+
+    def __contains__(self, keyword):
+        return keyword in SCHEMA
+
+    def get(self, keyword, default=None):
+        """Get parameter of 'keyword' without copying it. The returned
+        parameter should not be modified
+        """
+        if keyword not in SCHEMA:
+            return default
+        parameter = self._parameters.get(keyword)
+        if parameter is None:
+            return _EMPTY[keyword]
+        return parameter
+
+    def items(self):
+        """Iterate over all keywords and their parameters, in schema order,
+        without copying them
+        """
+        for keyword in SCHEMA:
+            yield keyword, self.get(keyword)
+
+    def values(self):
+        for keyword in SCHEMA:
+            yield self.get(keyword)
+
+    def clone(self):
+        """Copy-on-write copy. The parameters are shared until either side
+        modifies them
+        """
+        other = Parameters()
+        other._parameters = dict(self._parameters)
+        self._owned = set()
+        return other
+
+
+# shared empty parameters of keywords that have not been set
+_EMPTY = MappingProxyType({name: Parameter(keyword) for name, keyword in SCHEMA.items()})
+
+
 def _initialize_parameters():
     """Initialize all the possible parameters (and ensure that they are)
     reset before decalring another GOMC object
     """
-    parameters = {}
-    parameters["Restart"] = Parameter(bool)
-    parameters["RestartCheckpoint"] = Parameter(bool)
-    parameters["PRNG"] = Parameter(str)
-    parameters["Random_Seed"] = Parameter(int)
-    parameters["ParaTypeCHARMM"] = Parameter(bool)
-    parameters["ParaTypeEXOTIC"] = Parameter(bool)
-    parameters["ParaTypeMie"] = Parameter(bool)
-    parameters["ParaTypeMARTINI"] = Parameter(bool)
-    parameters["Parameters"] = Parameter(str)
-    parameters["Coordinates"] = Parameter(int, str, multiline=True)
-    parameters["Structure"] = Parameter(int, str, multiline=True)
-    parameters["Structures"] = Parameter(int, str, multiline=True)
-    parameters["MultiSimFolderName"] = Parameter(str)
-    parameters["GEMC"] = Parameter(str)
-    parameters["Pressure"] = Parameter(float)
-    parameters["Temperature"] = Parameter(float, float, float, float, float)
-    parameters["Rcut"] = Parameter(float)
-    parameters["RcutLow"] = Parameter(float)
-    parameters["RcutCoulomb"] = Parameter(int, float, multiline=True)
-    parameters["LRC"] = Parameter(bool)
-    parameters["Exclude"] = Parameter(str)
-    parameters["Potential"] = Parameter(str)
-    parameters["Rswitch"] = Parameter(float)
-    parameters["VDWGeometricSigma"] = Parameter(bool)
-    parameters["ElectroStatic"] = Parameter(bool)
-    parameters["Ewald"] = Parameter(bool)
-    parameters["CachedFourier"] = Parameter(bool)
-    parameters["Tolerance"] = Parameter(float)
-    parameters["Dielectric"] = Parameter(float)
-    parameters["PressureCalc"] = Parameter(bool, int)
-    parameters["1-4scaling"] = Parameter(float)
-    parameters["RunSteps"] = Parameter(int)
-    parameters["EqSteps"] = Parameter(int)
-    parameters["AdjSteps"] = Parameter(int)
-    parameters["ChemPot"] = Parameter(str, float)
-    parameters["Fugacity"] = Parameter(str, float)
-    parameters["DisFreq"] = Parameter(float)
-    parameters["RotFreq"] = Parameter(float)
-    parameters["IntraSwapFreq"] = Parameter(float)
-    parameters["RegrowthFreq"] = Parameter(float)
-    parameters["CrankShaftFreq"] = Parameter(float)
-    parameters["MultiParticleFreq"] = Parameter(float)
-    parameters["IntraMEMC-1Freq"] = Parameter(float)
-    parameters["IntraMEMC-2Freq"] = Parameter(float)
-    parameters["IntraMEMC-3Freq"] = Parameter(float)
-    parameters["MEMC-1Freq"] = Parameter(float)
-    parameters["MEMC-2Freq"] = Parameter(float)
-    parameters["MEMC-3Freq"] = Parameter(float)
-    parameters["SwapFreq"] = Parameter(float)
-    parameters["VolFreq"] = Parameter(float)
-    parameters["ExchangeVolumeDim"] = Parameter(float, float, float)
-    parameters["ExchangeSmallKind"] = Parameter(float)
-    parameters["ExchangeLargeKind"] = Parameter(float)
-    parameters["ExchangeRatio"] = Parameter(int)
-    parameters["LargeKindBackBone"] = Parameter(str, str)
-    parameters["SmallKindBackBone"] = Parameter(str, str)
-    parameters["useConstantArea"] = Parameter(bool)
-    parameters["FixVolBox0"] = Parameter(bool)
-    parameters["CellBasisVector1"] = Parameter(int, float, float, float,
-                                               multiline=True)
-    parameters["CellBasisVector2"] = Parameter(int, float, float, float,
-                                               multiline=True)
-    parameters["CellBasisVector3"] = Parameter(int, float, float, float,
-                                               multiline=True)
-    parameters["CBMC_First"] = Parameter(int)
-    parameters["CBMC_Nth"] = Parameter(int)
-    parameters["CBMC_Ang"] = Parameter(int)
-    parameters["CBMC_Dih"] = Parameter(int)
-    parameters["FreeEnergyCalc"] = Parameter(bool, int, repeat_last=True)
-    parameters["MoleculeType"] = Parameter(str, int)
-    parameters["InitialState"] = Parameter(int)
-    parameters["LambdaVDW"] = Parameter(float, repeat_last=True)
-    parameters["LambdaCoulomb"] = Parameter(float, repeat_last=True)
-    parameters["ScaleCoulomb"] = Parameter(bool)
-    parameters["ScalePower"] = Parameter(int)
-    parameters["ScaleAlpha"] = Parameter(float)
-    parameters["MinSigma"] = Parameter(float)
-    parameters["OutputName"] = Parameter(str)
-    parameters["CoordinatesFreq"] = Parameter(bool, int)
-    parameters["RestartFreq"] = Parameter(bool, int)
-    parameters["CheckpointFreq"] = Parameter(bool, int)
-    parameters["ConsoleFreq"] = Parameter(bool, int)
-    parameters["BlockAverageFreq"] = Parameter(bool, int)
-    parameters["HistogramFreq"] = Parameter(bool, int)
-    parameters["DistName"] = Parameter(str)
-    parameters["HistName"] = Parameter(str)
-    parameters["RunNumber"] = Parameter(int)
-    parameters["RunLetter"] = Parameter(str)
-    parameters["SampleFreq"] = Parameter(int)
-    parameters["OutEnergy"] = Parameter(bool, bool)
-    parameters["OutPressure"] = Parameter(bool, bool)
-    parameters["OutMolNum"] = Parameter(bool, bool)
-    parameters["OutDensity"] = Parameter(bool, bool)
-    parameters["OutVolume"] = Parameter(bool, bool)
-    parameters["OutSurfaceTension"] = Parameter(bool, bool)
-    parameters["OutHeat"] = Parameter(bool, bool)
-
-    return parameters
+    return Parameters()
@@ -0,0 +1,388 @@
+import os
+import mmap
+import numpy as np
+
+# column ranges (start, stop) of the fixed-width PDB atom record
+_COLUMNS = {'record': (0, 6), 'serial': (6, 11), 'name': (12, 16),
+            'resname': (17, 21), 'chain': (21, 22), 'resid': (22, 26),
+            'x': (30, 38), 'y': (38, 46), 'z': (46, 54),
+            'occupancy': (54, 60), 'beta': (60, 66), 'element': (76, 78)}
+
+ATOM_DTYPE = np.dtype([('serial', np.int64), ('name', 'U4'), ('resname', 'U4'),
+                       ('chain', 'U1'), ('resid', np.int64),
+                       ('coordinates', np.float64, (3,)),
+                       ('occupancy', np.float64), ('beta', np.float64),
+                       ('element', 'U2')])
+
+
+class PDB:
+    """Atoms and unit cell of a PDB file.
+
+    :param atoms: structured array of atoms, see ATOM_DTYPE
+    :type atoms: ndarray
+    :param cell: unit cell (a, b, c, alpha, beta, gamma) from the CRYST1
+        record, None if not present
+    :type cell: ndarray
+    """
+    def __init__(self, atoms, cell=None):
+        self.atoms = atoms
+        self.cell = cell
+
+    def __len__(self):
+        return len(self.atoms)
+
+    @property
+    def coordinates(self):
+        return self.atoms['coordinates']
+
+    @property
+    def names(self):
+        return self.atoms['name']
+
+    @property
+    def resids(self):
+        return self.atoms['resid']
+
+    @property
+    def serials(self):
+        return self.atoms['serial']
+
+
+def _line_bounds(arr):
+    """Find start and end (exclusive, without newline) of all lines in a
+    byte array
+    """
+    ends = np.flatnonzero(arr == 10)
+    if len(arr) > 0 and arr[-1] != 10:
+        ends = np.append(ends, len(arr))
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    return starts, ends
+
+
+def _field(arr, starts, ends, column):
+    """Extract a fixed-width column from all lines as a bytes array.
+    Characters beyond the end of a line are treated as blanks
+    """
+    first, last = _COLUMNS[column]
+    width = last - first
+    if len(starts) == 0:
+        return np.zeros(0, dtype=f'S{width}')
+    idx = starts[:, np.newaxis] + np.arange(first, last)
+    valid = idx < ends[:, np.newaxis]
+    chars = np.where(valid, arr[np.minimum(idx, len(arr) - 1)], 32)
+    chars = np.where(chars == 13, 32, chars).astype(np.uint8)
+    return np.ascontiguousarray(chars).view(f'S{width}').ravel()
+
+
+def _to_float(field):
+    try:
+        return field.astype(np.float64)
+    except ValueError:
+        values = np.zeros(len(field))
+        for i, value in enumerate(field):
+            try:
+                values[i] = float(value)
+            except ValueError:
+                pass
+        return values
+
+
+def _to_int(field, previous=0):
+    """Convert a column of integers. Entries that are not decimal numbers
+    (hexadecimal serials, '*****' overflow markers etc.) are continued from
+    the previous entry by incrementing it
+    """
+    try:
+        return np.char.strip(field).astype(np.int64)
+    except ValueError:
+        pass
+    values = np.empty(len(field), dtype=np.int64)
+    for i, raw in enumerate(field):
+        try:
+            values[i] = int(raw)
+        except ValueError:
+            values[i] = previous + 1
+        previous = values[i]
+    return values
+
+
+def _new_resid_state():
+    """Residue numbering state carried between chunks: last residue ID, raw
+    field and residue name, atom names of the current residue and the
+    number of atoms of complete residues by residue name
+    """
+    return {'value': 0, 'raw': None, 'resname': None, 'names': [],
+            'sizes': {}}
+
+
+def _restarts(state, name, resname):
+    """Return True if atom 'name' starts a new residue because the atom
+    name sequence of the current residue restarts
+    """
+    names = state['names']
+    if resname != state['resname'] or len(names) == 0:
+        return True
+    if resname in state['sizes']:
+        return len(names) >= state['sizes'][resname]
+    return name == names[0]
+
+
+def _to_resid(field, names, resnames, state):
+    """Convert a column of residue IDs. Entries that are not decimal
+    numbers ('****' overflow markers, hybrid-36 etc.) start a new residue
+    when the raw field changes or when the atom name sequence restarts, as
+    consecutive residues beyond 9999 share the same overflow marker
+    """
+    try:
+        values = np.char.strip(field).astype(np.int64)
+    except ValueError:
+        values = None
+    if values is not None:
+        if len(values) == 0:
+            return values
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(values)) + 1))
+        continued = values[0] == state['value'] and resnames[0] == state['resname']
+        if not continued and len(state['names']) > 0:
+            state['sizes'][state['resname']] = len(state['names'])
+        # sizes of the complete residues, the last one of every residue name
+        sizes = np.diff(starts)
+        if continued and len(sizes) > 0:
+            sizes[0] += len(state['names'])
+        kinds = resnames[starts[:-1]]
+        unique, last = np.unique(kinds[::-1], return_index=True)
+        for resname, i in zip(unique, len(kinds) - 1 - last):
+            state['sizes'][str(resname)] = int(sizes[i])
+        tail = [str(name) for name in names[starts[-1]:]]
+        if starts[-1] == 0 and continued:
+            tail = state['names'] + tail
+        state.update(value=int(values[-1]), raw=field[-1],
+                     resname=str(resnames[-1]), names=tail)
+        return values
+
+    values = np.empty(len(field), dtype=np.int64)
+    for i, (raw, name, resname) in enumerate(zip(field, names, resnames)):
+        name, resname = str(name), str(resname)
+        try:
+            value = int(raw)
+            new = value != state['value'] or resname != state['resname']
+        except ValueError:
+            new = raw != state['raw'] or _restarts(state, name, resname)
+            value = state['value'] + 1 if new else state['value']
+        if new:
+            if len(state['names']) > 0:
+                state['sizes'][state['resname']] = len(state['names'])
+            state['names'] = []
+        state['names'].append(name)
+        state.update(value=value, raw=raw, resname=resname)
+        values[i] = value
+    return values
+
+
+def _parse_atoms(arr, previous=None):
+    """Parse all ATOM/HETATM records of a byte array into a structured
+    array
+    """
+    starts, ends = _line_bounds(arr)
+    record = _field(arr, starts, ends, 'record')
+    is_atom = (record == b"ATOM  ") | (record == b"HETATM")
+    starts, ends = starts[is_atom], ends[is_atom]
+
+    if previous is None:
+        previous = {'serial': 0, 'resid': _new_resid_state()}
+    atoms = np.zeros(len(starts), dtype=ATOM_DTYPE)
+    for column in ('name', 'resname', 'chain', 'element'):
+        atoms[column] = np.char.strip(_field(arr, starts, ends, column)).astype(str)
+    atoms['serial'] = _to_int(_field(arr, starts, ends, 'serial'),
+                              previous['serial'])
+    if len(atoms) > 0:
+        previous['serial'] = atoms['serial'][-1]
+    atoms['resid'] = _to_resid(_field(arr, starts, ends, 'resid'),
+                               atoms['name'], atoms['resname'],
+                               previous['resid'])
+    for i, column in enumerate(('x', 'y', 'z')):
+        atoms['coordinates'][:, i] = _to_float(_field(arr, starts, ends, column))
+    for column in ('occupancy', 'beta'):
+        atoms[column] = _to_float(_field(arr, starts, ends, column))
+    return atoms
+
+
+def _parse_cell(arr):
+    """Parse unit cell from the first CRYST1 record of a byte array
+    """
+    position = bytes(arr[:min(len(arr), 1 << 16)]).find(b"CRYST1")
+    if position < 0:
+        return None
+    line = bytes(arr[position:position + 54]).decode()
+    try:
+        return np.asarray([float(line[6:15]), float(line[15:24]),
+                           float(line[24:33]), float(line[33:40]),
+                           float(line[40:47]), float(line[47:54])])
+    except ValueError:
+        return None
+
+
+def _as_bytes(source):
+    """Return a read-only byte array and a closing function for a filename,
+    a bytes buffer or a binary file object
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return np.frombuffer(source, dtype=np.uint8), lambda: None
+    if hasattr(source, "read"):
+        return np.frombuffer(source.read(), dtype=np.uint8), lambda: None
+    f = open(source, 'rb')
+    if os.fstat(f.fileno()).st_size == 0:
+        f.close()
+        return np.zeros(0, dtype=np.uint8), lambda: None
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arr = np.frombuffer(mm, dtype=np.uint8)
+
+    def close():
+        mm.close()
+        f.close()
+    return arr, close
+
+
+def read_pdb(source):
+    """Read atom records and unit cell of a PDB file. The standard
+    fixed-width columns are parsed straight from the (memory-mapped) bytes,
+    such that adjacent coordinate columns and atom serials beyond 99999 are
+    handled correctly.
+
+    :param source: filename, bytes buffer or binary file object
+    :type source: str or bytes or file
+    :returns: atoms and unit cell
+    :rtype: PDB
+    """
+    arr, close = _as_bytes(source)
+    try:
+        atoms = _parse_atoms(arr)
+        cell = _parse_cell(arr)
+    finally:
+        del arr
+        close()
+    return PDB(atoms, cell)
+
+
+def iter_pdb(filename, chunksize, blocksize=1 << 24):
+    """Iterate over the atom records of a PDB file in chunks of
+    'chunksize' atoms (the last chunk might be smaller). The file is read
+    in blocks of 'blocksize' bytes, such that memory usage is bounded
+    regardless of the file size.
+
+    :param filename: PDB file
+    :type filename: str
+    :param chunksize: number of atoms per chunk
+    :type chunksize: int
+    :param blocksize: number of bytes to read at a time
+    :type blocksize: int
+    """
+    previous = {'serial': 0, 'resid': _new_resid_state()}
+    pending = []
+    numpending = 0
+    remainder = b""
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            data = remainder + block
+            if block:
+                cut = data.rfind(b"\n") + 1
+                data, remainder = data[:cut], data[cut:]
+            atoms = _parse_atoms(np.frombuffer(data, dtype=np.uint8), previous)
+            pending.append(atoms)
+            numpending += len(atoms)
+            while numpending >= chunksize:
+                merged = np.concatenate(pending)
+                yield merged[:chunksize]
+                pending = [merged[chunksize:]]
+                numpending -= chunksize
+            if not block:
+                break
+    if numpending > 0:
+        yield np.concatenate(pending)
+
+
+def count_atoms(filename, blocksize=1 << 24):
+    """Count the number of atom records in a PDB file without parsing them
+    """
+    numatoms = 0
+    last = b"\n"
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            # the tail of the previous block is prepended to catch records
+            # split between blocks, without counting its records twice
+            data = last + block
+            numatoms += data.count(b"\nATOM  ") + data.count(b"\nHETATM")
+            numatoms -= last.count(b"\nATOM  ") + last.count(b"\nHETATM")
+            last = data[-7:]
+    return numatoms
+
+
+def write_atoms(filename, atoms, cell=None, remark="Generated by GOMC-wrapper"):
+    """Write atom records to a PDB file using the standard fixed-width
+    columns. Serials and residue IDs that do not fit their columns are
+    written as asterisks, like Packmol does
+
+    :param filename: output PDB file
+    :type filename: str
+    :param atoms: structured array of atoms, see ATOM_DTYPE
+    :type atoms: ndarray
+    :param cell: unit cell (a, b, c, alpha, beta, gamma) written to the
+        CRYST1 record
+    :type cell: list of float
+    """
+    serials = np.where(atoms['serial'] > 99999, "*****",
+                       atoms['serial'].astype(str))
+    resids = np.where(atoms['resid'] > 9999, "****", atoms['resid'].astype(str))
+
+    temp = "ATOM  {:>5} {:<4} {:<4}{:>5}    {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}\n"
+    with open(filename, 'w') as f:
+        if remark is not None:
+            f.write(f"REMARK   {remark}\n")
+        if cell is not None:
+            f.write("CRYST1{:9.3f}{:9.3f}{:9.3f}{:7.2f}{:7.2f}{:7.2f} P 1"
+                    "           1\n".format(*cell))
+        chunk = 1 << 16
+        for start in range(0, len(atoms), chunk):
+            stop = start + chunk
+            f.write("".join(
+                temp.format(serial, name, resname[:4], resid, x, y, z, occ, beta)
+                for serial, name, resname, resid, (x, y, z), occ, beta in zip(
+                    serials[start:stop], atoms['name'][start:stop],
+                    atoms['resname'][start:stop], resids[start:stop],
+                    atoms['coordinates'][start:stop],
+                    atoms['occupancy'][start:stop], atoms['beta'][start:stop])))
+        f.write("END\n")
+
+
+def read_cell(source):
+    """Read the unit cell (a, b, c, alpha, beta, gamma) from the CRYST1
+    record of a PDB file without parsing the atom records
+    """
+    arr, close = _as_bytes(source)
+    try:
+        cell = _parse_cell(arr)
+    finally:
+        del arr
+        close()
+    return cell
+
+
+def cell_to_hmatrix(cell):
+    """Convert unit cell parameters (a, b, c, alpha, beta, gamma) to cell
+    basis vectors, with the first vector along the x-axis
+    """
+    a, b, c = cell[:3]
+    alpha, beta, gamma = np.deg2rad(cell[3:6])
+    cx = c * np.cos(beta)
+    cy = c * (np.cos(alpha) - np.cos(beta) * np.cos(gamma)) / np.sin(gamma)
+    cz = np.sqrt(max(c**2 - cx**2 - cy**2, 0.0))
+    hmatrix = [[a, 0, 0],
+               [b * np.cos(gamma), b * np.sin(gamma), 0],
+               [cx, cy, cz]]
+    # remove round-off noise of orthogonal cells
+    return np.where(np.abs(hmatrix) < 1e-8, 0.0, hmatrix)
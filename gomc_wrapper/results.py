@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from .cache import _hash_file
+from .sweep import _referenced_files
+
+# content hashes of referenced files, keyed by path and validated by
+# modification time and size
+_hashed = {}
+
+
+def _file_hash(filename):
+    stat = os.stat(filename)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    path = os.path.abspath(filename)
+    if path not in _hashed or _hashed[path][0] != signature:
+        _hashed[path] = (signature, _hash_file(path, skip_comments=True))
+    return _hashed[path][1]
+
+
+def config_hash(gomc, gomc_exec=None):
+    """Canonical hash of a GOMC object, independent of the order the
+    parameters were set in. The content of the referenced parameter,
+    coordinate and structure files is hashed as well, such that the hash
+    identifies the simulation rather than the file names. Returns None if
+    a referenced file does not exist, as the simulation is then not
+    identified by its input
+
+    :param gomc: GOMC object
+    :type gomc: GOMC
+    :param gomc_exec: GOMC executable, included in the hash if given
+    :type gomc_exec: str
+    :rtype: str
+    """
+    parameters = {}
+    for keyword, parameter in gomc.parameters.items():
+        if len(parameter.values) == 0:
+            continue
+        if parameter.multiline:
+            parameters[keyword] = sorted(parameter.values.items())
+        else:
+            parameters[keyword] = parameter.values
+    files = {}
+    for file in _referenced_files(gomc):
+        path = gomc._path(file)
+        if not os.path.isfile(path):
+            return None
+        files[file] = _file_hash(path)
+    description = {'parameters': parameters, 'files': files, 'exec': gomc_exec}
+    string = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(string.encode()).hexdigest()
+
+
+def _default_store_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "gomc_wrapper",
+                        "results")
+
+
+class ResultStore:
+    """Local store of finished simulations, keyed by config_hash. A run
+    with a stored key is skipped, and the location of its output returned.
+
+    Example:
+        >>> store = ResultStore()
+        >>> gomc.run(store=store)   # runs GOMC
+        >>> gomc.run(store=store)   # returns the cached output directory
+
+    :param directory: store directory. Defaults to
+        ~/.cache/gomc_wrapper/results
+    :type directory: str
+    """
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = _default_store_dir()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def lookup(self, key):
+        """Stored result of 'key', None if there is no such result or its
+        output directory has been removed
+        """
+        try:
+            with open(self._entry(key), 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.isdir(result['directory']):
+            return None
+        return result
+
+    def store(self, key, directory, outputs=[]):
+        """Store a successfully finished run of 'key' with its output
+        directory and output files
+        """
+        result = {'directory': os.path.abspath(directory),
+                  'outputs': [os.path.abspath(output) for output in outputs],
+                  'time': time.time()}
+        fd, tmpfile = tempfile.mkstemp(prefix=".tmp_", dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmpfile, self._entry(key))
+
+    def remove(self, key):
+        """Forget the result of 'key'"""
+        try:
+            os.remove(self._entry(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,200 @@
+import os
+import sys
+import glob
+import time
+import asyncio
+import subprocess
+from .results import ResultStore, config_hash
+
+
+class RunResult:
+    """Result of a local GOMC run.
+
+    :param returncode: exit code of GOMC
+    :type returncode: int
+    :param pid: process ID
+    :type pid: int
+    :param start: start time (seconds since the epoch)
+    :type start: float
+    :param end: end time (seconds since the epoch)
+    :type end: float
+    :param cwd: directory GOMC was run in
+    :type cwd: str
+    :param input: GOMC input file
+    :type input: str
+    :param log: file containing the standard output and error of GOMC
+    :type log: str
+    :param outputs: output files written by GOMC (prefixed by OutputName)
+    :type outputs: list of str
+    :param cached: whether the result was taken from a ResultStore instead
+        of running GOMC
+    :type cached: bool
+    """
+    def __init__(self, returncode, pid, start, end, cwd, input, log,
+                 outputs=[], cached=False):
+        self.returncode = returncode
+        self.pid = pid
+        self.start = start
+        self.end = end
+        self.cwd = cwd
+        self.input = input
+        self.log = log
+        self.outputs = outputs
+        self.cached = cached
+
+    def __repr__(self):
+        return (f"RunResult(returncode={self.returncode}, "
+                f"elapsed={self.elapsed:.2f}, cwd='{self.cwd}')")
+
+    @property
+    def elapsed(self):
+        """Wall time of the run in seconds"""
+        return self.end - self.start
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+# output files GOMC writes, given the OutputName
+_OUTPUT_PATTERNS = ("{}_*", "Blk_{}_*", "Free_Energy_*_{}.*")
+
+
+def _outputs(self, cwd):
+    """Output files of a finished run, found from OutputName"""
+    values = self.parameters.get("OutputName").values
+    if len(values) == 0:
+        return []
+    name = glob.escape(str(values[0]))
+    outputs = set()
+    for pattern in _OUTPUT_PATTERNS:
+        outputs.update(glob.glob(os.path.join(glob.escape(cwd),
+                                              pattern.format(name))))
+    return sorted(outputs)
+
+
+async def run_async(self, gomc_exec='GOMC_CPU_NVT', num_procs=1,
+                    gomc_input='in.conf', log='out.log', cwd=None,
+                    affinity=None, store=None):
+    """Write the input file and run GOMC as a subprocess of the asyncio
+    event loop, waiting for it to finish without polling. Many jobs can
+    run concurrently in one event loop
+
+    Example:
+        >>> result = await gomc.run_async(num_procs=4)
+        >>> results = await asyncio.gather(
+        ...     *(job.run_async(cwd=wd) for wd, job in gomc.sweep(grid)))
+
+    :param gomc_exec: GOMC executable
+    :type gomc_exec: str
+    :param num_procs: number of threads
+    :type num_procs: int
+    :param gomc_input: GOMC input file, relative to 'cwd'
+    :type gomc_input: str
+    :param log: file collecting standard output and error, relative to
+        'cwd'
+    :type log: str
+    :param cwd: directory to run in. Defaults to the working directory of
+        the GOMC object, or the current working directory if not set
+    :type cwd: str
+    :param affinity: CPU cores to pin GOMC to (Linux only)
+    :type affinity: list of int
+    :param store: skip the run if an identical job has finished before,
+        and record the run if it finishes successfully
+    :type store: ResultStore
+    :rtype: RunResult
+    """
+    if cwd is None:
+        cwd = self.wd if self.wd is not None else os.getcwd()
+    if store is True:
+        store = ResultStore()
+    if store is not None:
+        key = config_hash(self, gomc_exec)
+        if key is None:
+            # missing input files, the run cannot be identified
+            store = None
+    if store is not None:
+        result = store.lookup(key)
+        if result is not None:
+            now = time.time()
+            return RunResult(0, None, now, now, result['directory'],
+                             os.path.join(result['directory'], gomc_input),
+                             os.path.join(result['directory'], log),
+                             result['outputs'], cached=True)
+    self.write(os.path.abspath(os.path.join(cwd, gomc_input)))
+    logfile = os.path.join(cwd, log)
+    preexec_fn = None
+    if affinity is not None and hasattr(os, "sched_setaffinity"):
+        cores = set(affinity)
+        preexec_fn = lambda: os.sched_setaffinity(0, cores)
+    with open(logfile, 'wb') as f:
+        start = time.time()
+        process = await asyncio.create_subprocess_exec(
+            gomc_exec, f"+p{num_procs}", gomc_input, cwd=cwd,
+            stdout=f, stderr=asyncio.subprocess.STDOUT, preexec_fn=preexec_fn)
+        returncode = await process.wait()
+        end = time.time()
+    outputs = _outputs(self, cwd)
+    if store is not None and returncode == 0:
+        store.store(key, cwd, outputs)
+    return RunResult(returncode, process.pid, start, end, cwd,
+                     os.path.join(cwd, gomc_input), logfile, outputs)
+
+
+def _value(self, keyword, default=None):
+    """First value of a keyword, 'default' if not set"""
+    values = self.parameters.get(keyword).values
+    return values[0] if len(values) > 0 else default
+
+
+def _restarted_since(filename, start):
+    """Return True if 'filename' has been written since time 'start'"""
+    try:
+        return os.stat(filename).st_mtime >= start
+    except OSError:
+        return False
+
+
+def _stream(self, command, console, detector=None):
+    """Run GOMC, echoing its standard output and feeding it line by line
+    to 'console'. If 'detector' reports equilibrium during the
+    equilibration steps, GOMC is stopped as soon as restart files have
+    been written within the equilibrated window, i.e. after its first
+    record was parsed. Until then, GOMC keeps running. The detector is
+    only asked when a new record arrives. Returns the process and the
+    step it was stopped at (None if it ran to the end)
+    """
+    eqsteps = _value(self, "EqSteps", 0)
+    outputname = _value(self, "OutputName")
+    restartfile = self._path(f"{outputname}_BOX_0_restart.pdb")
+
+    popen = subprocess.Popen(command, cwd=self.wd, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, text=True, bufsize=1)
+    stopped = None
+    since = None
+    for line in popen.stdout:
+        sys.stdout.write(line)
+        new = console.feed(line)
+        if detector is None or stopped is not None or outputname is None \
+                or console.step is None or console.step >= eqsteps:
+            continue
+        if since is None and new and detector(console):
+            since = detector.window_start(console)
+        if since is not None and _restarted_since(restartfile, since):
+            stopped = console.step
+            popen.terminate()
+    popen.wait()
+    return popen, stopped
+
+
+def _production(self):
+    """Production run restarted from the files of a stopped equilibration
+    run, with OutputName '<OutputName>_prod'
+    """
+    outputname = _value(self, "OutputName")
+    production = self.clone()
+    production.set_restart(outputname)
+    production.set("OutputName", f"{outputname}_prod")
+    production.set("RunSteps", _value(self, "RunSteps", 0) - _value(self, "EqSteps", 0))
+    production.set("EqSteps", 0)
+    return production
@@ -0,0 +1,123 @@
+import os
+import asyncio
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+class LocalScheduler:
+    """Queue of local GOMC jobs packed onto the CPU cores of the machine.
+    Every job occupies as many cores as threads it requests (+pN), and is
+    pinned to its cores such that concurrent jobs do not compete. A job is
+    started as soon as enough cores are free; smaller jobs further back in
+    the queue are started ahead of a job that does not fit yet (backfill).
+
+    Example:
+        >>> scheduler = LocalScheduler(oversubscription=1)
+        >>> for wd, job in gomc.sweep(grid):
+        ...     scheduler.submit(job, num_procs=4, cwd=wd)
+        >>> results = scheduler.run()
+
+    :param cores: cores to schedule on, a subset of the cores available
+        to the process. Defaults to all of them
+    :type cores: list of int
+    :param oversubscription: number of jobs allowed to share a core
+    :type oversubscription: int
+    :param pin: pin jobs to their cores using CPU affinity (Linux only)
+    :type pin: bool
+    """
+    def __init__(self, cores=None, oversubscription=1, pin=True):
+        available = _available_cores()
+        if cores is None:
+            cores = available
+        cores = sorted(set(cores))
+        unavailable = sorted(set(cores) - set(available))
+        if not cores:
+            raise ValueError("No cores to schedule on")
+        if unavailable:
+            raise ValueError(f"Cores {unavailable} are not available to the "
+                             f"process, which may run on {available}")
+        self.cores = cores
+        self.oversubscription = oversubscription
+        self.pin = pin
+        self.jobs = []
+        self.load = {core: 0 for core in self.cores}
+
+    def submit(self, gomc, num_procs=1, **kwargs):
+        """Add job to the queue. Keyword arguments are passed on to
+        GOMC.run_async
+
+        :param gomc: GOMC object to run
+        :type gomc: GOMC
+        :param num_procs: number of threads, i.e. cores occupied
+        :type num_procs: int
+        :returns: index of the job in the results
+        :rtype: int
+        """
+        if num_procs > len(self.cores):
+            raise ValueError(f"Job requests {num_procs} cores, but only "
+                             f"{len(self.cores)} are available")
+        self.jobs.append((gomc, num_procs, kwargs))
+        return len(self.jobs) - 1
+
+    def _allocate(self, num_procs):
+        """Reserve the 'num_procs' least loaded cores that are not full,
+        None if there are too few of them
+        """
+        free = [core for core in self.cores
+                if self.load[core] < self.oversubscription]
+        if len(free) < num_procs:
+            return None
+        cores = sorted(free, key=lambda core: self.load[core])[:num_procs]
+        for core in cores:
+            self.load[core] += 1
+        return cores
+
+    def _release(self, cores):
+        for core in cores:
+            self.load[core] -= 1
+
+    async def _start(self, i, cores):
+        gomc, num_procs, kwargs = self.jobs[i]
+        affinity = cores if self.pin else None
+        try:
+            return await gomc.run_async(num_procs=num_procs, affinity=affinity,
+                                        **kwargs)
+        finally:
+            self._release(cores)
+
+    async def run_async(self):
+        """Run all queued jobs and empty the queue. Exceptions raised by a
+        job (e.g. a missing executable) are returned in place of its result
+
+        :returns: results in submission order
+        :rtype: list of RunResult
+        """
+        results = [None] * len(self.jobs)
+        waiting = list(range(len(self.jobs)))
+        running = {}
+        while waiting or running:
+            for i in list(waiting):
+                cores = self._allocate(self.jobs[i][1])
+                if cores is None:
+                    continue
+                waiting.remove(i)
+                running[asyncio.ensure_future(self._start(i, cores))] = i
+            done, _ = await asyncio.wait(running,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = running.pop(task)
+                try:
+                    results[i] = task.result()
+                except Exception as e:
+                    results[i] = e
+        self.jobs = []
+        return results
+
+    def run(self):
+        """Run all queued jobs in a new event loop, see run_async
+        """
+        return asyncio.run(self.run_async())
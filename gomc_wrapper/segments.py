@@ -0,0 +1,124 @@
+import os
+import re
+import subprocess
+from .file_handling import write_jobscript
+from .runner import _value
+from .slurm import FINAL_STATES, _query
+
+
+def segments(self, steps, checkpoint=True):
+    """Split the run into segments of at most 'steps' steps, each
+    restarting from the restart (and checkpoint) files of the previous
+    one. Segment i writes its output with OutputName '<OutputName>_<i>'
+    and RunNumber i + 1. The equilibration steps are carried over to the
+    segments they fall into
+
+    :param steps: maximum number of steps per segment
+    :type steps: int
+    :param checkpoint: restart from checkpoint files (RestartCheckpoint)
+    :type checkpoint: bool
+    :returns: GOMC object of every segment
+    :rtype: list of GOMC
+    """
+    outputname = _value(self, "OutputName")
+    if outputname is None:
+        raise ValueError("OutputName has to be set to run in segments")
+    runsteps = _value(self, "RunSteps", 0)
+    eqsteps = _value(self, "EqSteps", 0)
+
+    configs = []
+    for i, start in enumerate(range(0, runsteps, steps)):
+        segment = self.clone()
+        if i > 0:
+            segment.set_restart(f"{outputname}_{i - 1}", checkpoint=checkpoint)
+        segment.set("OutputName", f"{outputname}_{i}")
+        segment.set("RunNumber", i + 1)
+        segment.set("RunSteps", min(steps, runsteps - start))
+        segment.set("EqSteps", min(max(eqsteps - start, 0), steps))
+        if len(segment.parameters.get("RestartFreq").values) == 0:
+            segment.set("RestartFreq", True, steps)
+        if checkpoint and len(segment.parameters.get("CheckpointFreq").values) == 0:
+            segment.set("CheckpointFreq", True, steps)
+        configs.append(segment)
+    return configs
+
+
+def _alive(job_id):
+    """Return True if Slurm job 'job_id' is queued or running"""
+    queue = _query(["squeue", "-h", "-o", "%T", "-j", str(job_id)])
+    if queue is None:
+        raise RuntimeError(f"Cannot find out whether job {job_id} is still "
+                           "queued, squeue failed")
+    return any(fields[0] not in FINAL_STATES for fields in queue)
+
+
+def _cancel(job_id):
+    """Cancel Slurm job 'job_id'"""
+    try:
+        subprocess.run(["scancel", str(job_id)], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        raise RuntimeError(f"Cannot cancel job {job_id}, scancel failed")
+
+
+def run_segments(self, steps, gomc_exec='GOMC_CPU_NVT', num_procs=1,
+                 gomc_input='in.conf', slurm=False, slurm_args={},
+                 checkpoint=True):
+    """Run in segments of at most 'steps' steps (see segments), either
+    locally in sequence or as a chain of Slurm jobs where every job
+    depends on the successful completion of the previous one
+    (--dependency=afterok). Segment i uses the input file
+    '<gomc_input>_<i>' and leaves a '.done' file next to it when it has
+    finished successfully. The job ID of a submitted segment is saved in a
+    '.job' file next to the input file. Finished segments, and segments
+    whose job is still queued or running, are skipped, such that an
+    interrupted chain is resumed by calling this method again. Once a
+    segment is submitted again, the queued jobs of all later segments
+    depend on a job that will never run. They are cancelled and submitted
+    again, depending on the new job
+
+    :param steps: maximum number of steps per segment
+    :type steps: int
+    :returns: job ID of every segment that was started
+    :rtype: list of int
+    """
+    base, ext = os.path.splitext(gomc_input)
+    job_ids = []
+    previous = None
+    for i, segment in enumerate(self.segments(steps, checkpoint=checkpoint)):
+        inputfile = f"{base}_{i}{ext}"
+        donefile = f"{inputfile}.done"
+        jobfile = self._path(f"{inputfile}.job")
+        if os.path.isfile(self._path(donefile)):
+            continue
+        if slurm and os.path.isfile(jobfile):
+            with open(jobfile, 'r') as f:
+                job_id = int(f.read())
+            if _alive(job_id):
+                if not job_ids:
+                    previous = job_id
+                    continue
+                # an earlier segment was submitted again in this call
+                _cancel(job_id)
+        segment.write(inputfile)
+        executable = f"{gomc_exec} +p{num_procs} {inputfile}"
+        if slurm:
+            args = dict(slurm_args)
+            if previous is not None:
+                args['dependency'] = f"afterok:{previous}"
+            jobscript = f"job_{i}.sh"
+            write_jobscript(self._path(jobscript),
+                            f"{executable} && touch {donefile}", args)
+            output = subprocess.check_output(['sbatch', jobscript], cwd=self.wd)
+            previous = int(re.findall("([0-9]+)", str(output))[0])
+            job_ids.append(previous)
+            with open(jobfile, 'w') as f:
+                f.write(f"{previous}\n")
+        else:
+            popen = subprocess.Popen(executable.split(), cwd=self.wd)
+            job_ids.append(popen.pid)
+            if popen.wait() != 0:
+                raise RuntimeError(f"Segment {i} failed with exit code "
+                                   f"{popen.returncode}")
+            open(self._path(donefile), 'w').close()
+    return job_ids
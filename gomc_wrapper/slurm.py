@@ -0,0 +1,310 @@
+import os
+import re
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import Future
+from .file_handling import write_jobscript
+
+
+class ArrayJob:
+    """Handle of a submitted Slurm job array, mapping array indices to
+    GOMC objects and their job directories. Arrays larger than the
+    MaxArraySize of Slurm are submitted as several job arrays of
+    'arraysize' tasks each, with one job ID per array
+
+    :param job_ids: Slurm job ID of every array
+    :type job_ids: list of int
+    :param directories: job directory of every array task
+    :type directories: list of str
+    :param configs: GOMC object of every array task
+    :type configs: list of GOMC
+    :param arraysize: number of tasks per array. Defaults to all tasks
+    :type arraysize: int
+    """
+    def __init__(self, job_ids, directories, configs, arraysize=None):
+        if isinstance(job_ids, int):
+            job_ids = [job_ids]
+        self.job_ids = list(job_ids)
+        self.directories = directories
+        self.configs = configs
+        self.arraysize = arraysize or max(len(configs), 1)
+
+    def __repr__(self):
+        return f"ArrayJob(job_ids={self.job_ids}, numtasks={len(self)})"
+
+    def __len__(self):
+        return len(self.configs)
+
+    def __getitem__(self, i):
+        return self.configs[i]
+
+    @property
+    def job_id(self):
+        """Job ID of the first array"""
+        return self.job_ids[0]
+
+    def task_id(self, i):
+        """Slurm ID of array task 'i', e.g. '1234_5'"""
+        array, index = divmod(i, self.arraysize)
+        return f"{self.job_ids[array]}_{index}"
+
+    @property
+    def task_ids(self):
+        return [self.task_id(i) for i in range(len(self))]
+
+
+def submit_array(jobs, gomc_exec='GOMC_CPU_NVT', num_procs=1,
+                 gomc_input='in.conf', slurm_args={}, directory=None,
+                 jobscript='array.sh', max_concurrent=None,
+                 max_array_size=1001):
+    """Submit many GOMC jobs as a single Slurm job array. The input file of
+    every job is written to its working directory, and one job script
+    that changes to the directory of its array task is submitted with a
+    single sbatch call. If there are more jobs than 'max_array_size', they
+    are split into several arrays with the job scripts
+    '<jobscript>_<i>', submitted with one sbatch call each
+
+    Example:
+        >>> array = submit_array(gomc.sweep(grid), num_procs=4,
+        ...                      slurm_args={'time': '02:00:00'})
+        >>> array.directories[3], array[3]
+
+    :param jobs: GOMC objects with a working directory, or pairs of job
+        directories and GOMC objects as returned by sweep
+    :type jobs: list
+    :param slurm_args: sbatch options used for every array task
+    :type slurm_args: dict
+    :param directory: directory of the job script and the task list.
+        Defaults to the common directory of the jobs
+    :type directory: str
+    :param max_concurrent: maximum number of simultaneously running tasks
+        of every array
+    :type max_concurrent: int
+    :param max_array_size: maximum number of tasks per array, i.e. the
+        MaxArraySize of the Slurm configuration
+    :type max_array_size: int
+    :rtype: ArrayJob
+    """
+    directories, configs = [], []
+    for job in jobs:
+        if isinstance(job, tuple):
+            wd, gomc = job
+        else:
+            wd, gomc = job.wd, job
+        if wd is None:
+            raise ValueError("Every job needs a working directory")
+        directories.append(os.path.abspath(wd))
+        configs.append(gomc)
+    if len(configs) == 0:
+        raise ValueError("No jobs to submit")
+
+    for wd, gomc in zip(directories, configs):
+        gomc.write(os.path.join(wd, gomc_input))
+
+    if directory is None:
+        directory = os.path.commonpath(directories)
+    directory = os.path.abspath(directory)
+    # the task list is given by its absolute path, as the job might start
+    # in another directory (e.g. with the chdir option)
+    tasklist = os.path.join(directory, f"{jobscript}.tasks")
+    with open(tasklist, 'w') as f:
+        f.write("\n".join(directories) + "\n")
+
+    starts = range(0, len(configs), max_array_size)
+    base, ext = os.path.splitext(jobscript)
+    job_ids = []
+    for i, start in enumerate(starts):
+        numtasks = min(max_array_size, len(configs) - start)
+        array = f"0-{numtasks - 1}"
+        if max_concurrent is not None:
+            array += f"%{max_concurrent}"
+        executable = f'cd "$(sed -n "$((SLURM_ARRAY_TASK_ID + {start + 1}))p" "{tasklist}")"\n' \
+            + f"{gomc_exec} +p{num_procs} {gomc_input}"
+        script = jobscript if len(starts) == 1 else f"{base}_{i}{ext}"
+        write_jobscript(os.path.join(directory, script), executable,
+                        dict(slurm_args, array=array))
+        output = subprocess.check_output(['sbatch', script], cwd=directory)
+        job_ids.append(int(re.findall("([0-9]+)", str(output))[0]))
+    return ArrayJob(job_ids, directories, configs, max_array_size)
+
+
+# Slurm job states after which a job will not change any more
+FINAL_STATES = ("COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY",
+                "NODE_FAIL", "PREEMPTED", "BOOT_FAIL", "DEADLINE", "REVOKED",
+                "UNKNOWN")
+
+
+def _query(command):
+    """Run a Slurm query command and return its lines as lists of fields,
+    None if the command is not available or fails
+    """
+    try:
+        output = subprocess.run(command, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [line.split("|") for line in output.decode().splitlines() if line]
+
+
+class SlurmTracker:
+    """Track the states of many Slurm jobs (or array tasks) with a single
+    squeue call per poll, asking sacct only for jobs that have left the
+    queue. The polling interval grows exponentially while no job changes
+    state. Every tracked job has a future that is resolved with its final
+    state, and an optional callback. Jobs found neither in the queue nor in
+    the accounting database are considered pending for 'grace' seconds,
+    as accounting records may appear with a delay, and UNKNOWN after that.
+
+    Example:
+        >>> tracker = SlurmTracker()
+        >>> futures = tracker.track_array(array)
+        >>> tracker.wait()
+        >>> [future.result() for future in futures]
+        ['COMPLETED', 'COMPLETED', 'FAILED']
+
+    :param interval: initial polling interval in seconds
+    :type interval: float
+    :param max_interval: maximum polling interval in seconds
+    :type max_interval: float
+    :param backoff: factor the interval grows by when nothing changed
+    :type backoff: float
+    :param grace: seconds a job that cannot be found is considered pending
+    :type grace: float
+    :param max_failures: number of consecutive failed squeue calls after
+        which polling raises a RuntimeError
+    :type max_failures: int
+    """
+    def __init__(self, interval=5.0, max_interval=300.0, backoff=2.0,
+                 grace=120.0, max_failures=5):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.grace = grace
+        self.max_failures = max_failures
+        self.states = {}
+        self.futures = {}
+        self._missing = {}
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def track(self, job_id, callback=None):
+        """Track job 'job_id' (e.g. 1234 or '1234_5' for an array task)
+
+        :param callback: function called with the job ID and the final
+            state when the job has finished
+        :type callback: callable
+        :returns: future resolved with the final state
+        :rtype: concurrent.futures.Future
+        """
+        job_id = str(job_id)
+        with self._lock:
+            if job_id not in self.futures:
+                self.futures[job_id] = Future()
+                self.states.setdefault(job_id, "PENDING")
+            future = self.futures[job_id]
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(job_id, f.result()))
+        return future
+
+    def track_array(self, array, callback=None):
+        """Track all tasks of an ArrayJob, returning their futures"""
+        return [self.track(task_id, callback) for task_id in array.task_ids]
+
+    def pending(self):
+        """Jobs that have not reached a final state"""
+        with self._lock:
+            return [job_id for job_id, future in self.futures.items()
+                    if not future.done()]
+
+    def poll(self):
+        """Query the states of all unfinished jobs once and resolve the
+        futures of finished jobs. Returns True if any state changed. Raises
+        a RuntimeError if squeue has failed 'max_failures' times in a row
+        """
+        pending = self.pending()
+        if len(pending) == 0:
+            return False
+        jobs = ",".join(sorted({job_id.split("_")[0] for job_id in pending}))
+        if shutil.which("squeue") is None:
+            raise RuntimeError("squeue not found, cannot track Slurm jobs")
+        queue = _query(["squeue", "-h", "-r", "-o", "%i|%T", "-j", jobs])
+        if queue is None:
+            # try again next time, e.g. if the controller is busy
+            self._failures += 1
+            if self._failures >= self.max_failures:
+                raise RuntimeError(f"squeue failed {self._failures} times in "
+                                   "a row, cannot track Slurm jobs")
+            return False
+        self._failures = 0
+        states = {fields[0]: fields[1] for fields in queue if len(fields) == 2}
+
+        gone = [job_id for job_id in pending if job_id not in states]
+        if gone:
+            # jobs that have left the queue are looked up in the accounting
+            # database, and assumed finished if not found there within the
+            # grace period
+            jobs = ",".join(sorted({job_id.split("_")[0] for job_id in gone}))
+            accounting = _query(["sacct", "-n", "-P", "-X", "-o", "JobID,State",
+                                 "-j", jobs]) or []
+            for fields in accounting:
+                if len(fields) == 2 and fields[0] in gone:
+                    states[fields[0]] = fields[1].split()[0]
+            now = time.time()
+            for job_id in gone:
+                if job_id in states:
+                    self._missing.pop(job_id, None)
+                elif now - self._missing.setdefault(job_id, now) >= self.grace:
+                    states[job_id] = "UNKNOWN"
+
+        changed = False
+        finished = []
+        with self._lock:
+            for job_id in pending:
+                state = states.get(job_id, self.states[job_id])
+                changed |= state != self.states[job_id]
+                self.states[job_id] = state
+                if state in FINAL_STATES:
+                    finished.append((self.futures[job_id], state))
+        for future, state in finished:
+            future.set_result(state)
+        return changed
+
+    def wait(self, timeout=None):
+        """Poll until all tracked jobs have finished, or until 'timeout'
+        seconds have passed. Returns True if all jobs have finished. Raises
+        a RuntimeError if squeue keeps failing
+        """
+        start = time.time()
+        interval = self.interval
+        while True:
+            if self.poll():
+                interval = self.interval
+            if not self.pending():
+                return True
+            if timeout is not None and time.time() + interval > start + timeout:
+                return False
+            time.sleep(interval)
+            interval = min(interval * self.backoff, self.max_interval)
+
+    def start(self):
+        """Poll in a background thread until all tracked jobs have
+        finished, such that futures and callbacks are resolved while the
+        caller continues. If squeue keeps failing, the futures of the
+        unfinished jobs are resolved with the RuntimeError
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._wait, daemon=True)
+            self._thread.start()
+
+    def _wait(self):
+        try:
+            self.wait()
+        except RuntimeError as e:
+            with self._lock:
+                futures = [future for future in self.futures.values()
+                           if not future.done()]
+            for future in futures:
+                future.set_exception(e)
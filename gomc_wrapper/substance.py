@@ -54,7 +54,9 @@ class TIP4P2005(Substance):
         return "TIP4P/2005"
 
     def set_parameters(self, Z_H, r0, OM, theta, epsilon, sigma):
-        """Set TIP4P parameters
+        """Set TIP4P parameters. The geometric parameters might be arrays
+        of candidate values, which write_molecule turns into a batch of
+        geometries in one call
         """
         self.charges['H'] = Z_H
         self.charges['M'] = - 2 * Z_H
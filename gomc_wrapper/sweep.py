@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+# keywords referring to input files that every job directory needs
+_INPUT_KEYWORDS = ("Parameters", "Coordinates", "Structure")
+
+
+def _link(source, target, link=True):
+    """Hardlink 'source' to 'target' if possible, otherwise copy it"""
+    if os.path.lexists(target):
+        os.remove(target)
+    if link:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+
+
+def _referenced_files(gomc):
+    """Paths of all input files referred to by the parameters"""
+    files = []
+    for keyword in _INPUT_KEYWORDS:
+        parameter = gomc.parameters.get(keyword)
+        if parameter.multiline:
+            files += [value[-1] for value in parameter.values.values()]
+        else:
+            files += list(parameter.values)
+    return files
+
+
+def _input_files(gomc):
+    """Relative paths of the input files referred to by the parameters"""
+    return [file for file in _referenced_files(gomc) if not os.path.isabs(file)]
+
+
+def _expand(changes):
+    """Expand a grid (dict of lists of values) or a list of dicts into a
+    list of dicts
+    """
+    if isinstance(changes, dict):
+        keywords = list(changes.keys())
+        return [dict(zip(keywords, values))
+                for values in itertools.product(*changes.values())]
+    return [dict(change) for change in changes]
+
+
+def sweep(self, changes, directory="sweep", files=[], name="job{:05d}",
+          gomc_input="in.conf", verbose=True, link=True, num_threads=8,
+          allow_missing=False):
+    """Write a job directory with a GOMC input file for every variant of
+    the GOMC object. The variants are given either as a grid, where every
+    combination of the values is used, or as a list of changes. Values are
+    given as in derive. Input files (the parameter, coordinate and
+    structure files referred to, and 'files') are hardlinked into every
+    job directory, or copied if linking is not possible. An index of the
+    job directories and their changes is written to 'sweep.json'. Paths
+    are relative to the working directory, and every returned GOMC object
+    has its job directory as working directory. Missing input files raise
+    a FileNotFoundError unless 'allow_missing' is set, in which case they
+    are skipped
+
+    Example:
+        >>> jobs = gomc.sweep({"Temperature": [280, 300, 320],
+        ...                    "Pressure": [1.0, 10.0]})
+        >>> jobs = gomc.sweep([{"LambdaVDW": (0.0, 0.5, 1.0)},
+        ...                    {"LambdaVDW": (0.0, 0.2, 1.0)}])
+
+    :param changes: grid of keywords and lists of values, or list of
+        dictionaries of keywords and values
+    :type changes: dict or list of dict
+    :param directory: directory containing the job directories
+    :type directory: str
+    :param files: additional input files to link into the job directories
+    :type files: list of str
+    :param name: name template of the job directories
+    :type name: str
+    :param num_threads: number of threads used for file I/O
+    :type num_threads: int
+    :param allow_missing: skip missing input files instead of raising
+    :type allow_missing: bool
+    :returns: job directories and GOMC objects
+    :rtype: list of tuple
+    """
+    variants = _expand(changes)
+    inputs = _input_files(self) + list(files)
+    missing = [file for file in inputs if not os.path.isfile(self._path(file))]
+    if missing and not allow_missing:
+        raise FileNotFoundError("Input files of the sweep not found: "
+                                + ", ".join(missing))
+    inputs = [file for file in inputs if file not in missing]
+    directory = self._path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    def write_job(args):
+        i, change = args
+        gomc = self.derive(change)
+        gomc.wd = wd = os.path.join(directory, name.format(i))
+        os.makedirs(wd, exist_ok=True)
+        for file in inputs:
+            target = os.path.join(wd, file)
+            if os.path.dirname(file):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+            _link(self._path(file), target, link)
+        gomc.write(gomc_input, verbose=verbose)
+        return wd, gomc
+
+    with ThreadPoolExecutor(num_threads) as executor:
+        jobs = list(executor.map(write_job, enumerate(variants)))
+
+    index = [{'directory': os.path.relpath(wd, directory), 'changes': change}
+             for (wd, _), change in zip(jobs, variants)]
+    with open(os.path.join(directory, "sweep.json"), 'w') as f:
+        json.dump(index, f, indent=1, default=str)
+    return jobs
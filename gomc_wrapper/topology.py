@@ -0,0 +1,209 @@
+import os
+import pickle
+import hashlib
+import numpy as np
+
+_CACHE_VERSION = 1
+_compiled = {}
+
+
+class Residue:
+    """Array-backed template of a single residue (RESI block) in a CHARMM
+    topology file. All connectivity arrays hold zero-based indices into
+    the atom arrays of the residue.
+    """
+    def __init__(self, name, charge=0.0):
+        self.name = name
+        self.charge = charge
+        self.labels = np.zeros(0, dtype=str)
+        self.types = np.zeros(0, dtype=str)
+        self.charges = np.zeros(0)
+        self.masses = np.zeros(0)
+        self.bonds = np.zeros((0, 2), dtype=int)
+        self.angles = np.zeros((0, 3), dtype=int)
+        self.dihedrals = np.zeros((0, 4), dtype=int)
+
+    def __repr__(self):
+        return f"Residue({self.name}, {len(self.labels)} atoms)"
+
+    @property
+    def numatoms(self):
+        return len(self.labels)
+
+
+class Topology:
+    """Compiled CHARMM topology file
+    """
+    def __init__(self):
+        self.masses = {}
+        self.first = "NONE"
+        self.last = "NONE"
+        self.autogenerate = []
+        self.residues = {}
+
+    def residue(self, name=None):
+        """Get residue template by name. If the name is not given, the
+        topology is expected to contain a single residue
+        """
+        if name is not None:
+            return self.residues[name]
+        if len(self.residues) != 1:
+            raise ValueError("Topology contains several residues, "
+                             "please specify residue name")
+        return next(iter(self.residues.values()))
+
+
+def generate_angles(bonds, numatoms):
+    """Generate all angles i-j-k from a bond graph, where i and k are both
+    bonded to j
+    """
+    neighbors = _neighbors(bonds, numatoms)
+    angles = []
+    for j in range(numatoms):
+        for a, i in enumerate(neighbors[j]):
+            for k in neighbors[j][a+1:]:
+                angles.append([i, j, k])
+    return np.asarray(angles, dtype=int).reshape(-1, 3)
+
+
+def generate_dihedrals(bonds, numatoms):
+    """Generate all proper dihedrals i-j-k-l from a bond graph, where j-k
+    is a bond, i is bonded to j and l is bonded to k
+    """
+    neighbors = _neighbors(bonds, numatoms)
+    dihedrals = []
+    for j, k in bonds:
+        for i in neighbors[j]:
+            if i == k:
+                continue
+            for l in neighbors[k]:
+                if l == j or l == i:
+                    continue
+                dihedrals.append([i, j, k, l])
+    return np.asarray(dihedrals, dtype=int).reshape(-1, 4)
+
+
+def _neighbors(bonds, numatoms):
+    neighbors = [[] for _ in range(numatoms)]
+    for i, j in bonds:
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+    return neighbors
+
+
+def _parse_topology(text):
+    """Parse the contents of a CHARMM topology file into a Topology object
+    """
+    topology = Topology()
+    blocks = []
+    for line in text.splitlines():
+        line = line.split("!")[0]
+        splitted = line.split()
+        if len(splitted) == 0 or line.startswith("*"):
+            continue
+        keyword = splitted[0].upper()
+        if keyword == "MASS":
+            topology.masses[splitted[2]] = float(splitted[3])
+        elif keyword == "DEFA":
+            topology.first = splitted[2]
+            topology.last = splitted[4]
+        elif keyword == "AUTO" or keyword == "AUTOGENERATE":
+            topology.autogenerate = [auto.upper() for auto in splitted[1:]]
+        elif keyword == "RESI":
+            charge = float(splitted[2]) if len(splitted) > 2 else 0.0
+            blocks.append({'name': splitted[1], 'charge': charge, 'atoms': [],
+                           'bonds': [], 'angles': [], 'dihedrals': []})
+        elif keyword == "ATOM" and blocks:
+            blocks[-1]['atoms'].append(splitted[1:4])
+        elif keyword in ("BOND", "DOUBLE", "TRIPLE") and blocks:
+            blocks[-1]['bonds'] += _group(splitted[1:], 2)
+        elif keyword in ("ANGL", "ANGLE", "THET", "THETA") and blocks:
+            blocks[-1]['angles'] += _group(splitted[1:], 3)
+        elif keyword in ("DIHE", "DIHEDRAL", "PHI") and blocks:
+            blocks[-1]['dihedrals'] += _group(splitted[1:], 4)
+        elif keyword == "END":
+            break
+
+    for block in blocks:
+        residue = Residue(block['name'], block['charge'])
+        labels = [atom[0] for atom in block['atoms']]
+        index = {label: i for i, label in enumerate(labels)}
+        residue.labels = np.asarray(labels, dtype=str)
+        residue.types = np.asarray([atom[1] for atom in block['atoms']], dtype=str)
+        residue.charges = np.asarray([float(atom[2]) for atom in block['atoms']])
+        residue.masses = np.asarray([topology.masses[atom[1]] for atom in block['atoms']])
+        residue.bonds = _to_indices(block['bonds'], index, 2)
+
+        if "ANGLES" in topology.autogenerate:
+            residue.angles = generate_angles(residue.bonds, len(labels))
+        else:
+            residue.angles = _to_indices(block['angles'], index, 3)
+        if "DIHEDRALS" in topology.autogenerate:
+            residue.dihedrals = generate_dihedrals(residue.bonds, len(labels))
+        else:
+            residue.dihedrals = _to_indices(block['dihedrals'], index, 4)
+        topology.residues[residue.name] = residue
+    return topology
+
+
+def _group(items, size):
+    return [items[i:i+size] for i in range(0, len(items) - size + 1, size)]
+
+
+def _to_indices(entries, index, size):
+    return np.asarray([[index[label] for label in entry] for entry in entries],
+                      dtype=int).reshape(-1, size)
+
+
+def _default_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "gomc_wrapper",
+                        "topology")
+
+
+def compile_topology(filename="topology.inp", cache_dir=None, use_cache=True):
+    """Compile a CHARMM topology file into array-backed residue templates.
+    Angles and dihedrals are generated from the bond graph when the
+    AUTOGENERATE directive asks for it.
+
+    Compiled topologies are cached in memory and on disk, keyed by the
+    hash of the file content, such that a topology is only parsed once.
+
+    :param filename: CHARMM topology file
+    :type filename: str
+    :param cache_dir: directory of on-disk cache. Defaults to
+        ~/.cache/gomc_wrapper/topology
+    :type cache_dir: str
+    :param use_cache: whether to look up and store compiled topologies
+    :type use_cache: bool
+    :returns: compiled topology
+    :rtype: Topology
+    """
+    with open(filename, 'rb') as f:
+        content = f.read()
+    if not use_cache:
+        return _parse_topology(content.decode())
+
+    key = f"{hashlib.sha256(content).hexdigest()}_v{_CACHE_VERSION}"
+    if key in _compiled:
+        return _compiled[key]
+
+    if cache_dir is None:
+        cache_dir = _default_cache_dir()
+    cachefile = os.path.join(cache_dir, key + ".pkl")
+    try:
+        with open(cachefile, 'rb') as f:
+            topology = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        topology = _parse_topology(content.decode())
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmpfile = f"{cachefile}.{os.getpid()}.tmp"
+            with open(tmpfile, 'wb') as f:
+                pickle.dump(topology, f)
+            os.replace(tmpfile, cachefile)
+        except OSError:
+            # caching is an optimization only, a read-only file system
+            # should not prevent compilation
+            pass
+    _compiled[key] = topology
+    return topology
@@ -0,0 +1,214 @@
+import os
+import mmap
+import numpy as np
+from .pdbfile import _parse_atoms, _parse_cell
+
+
+class Frame:
+    """Single frame of a trajectory.
+
+    :param coordinates: atom coordinates of shape (numatoms, 3)
+    :type coordinates: ndarray
+    :param cell: unit cell (a, b, c, alpha, beta, gamma), None if unknown
+    :type cell: ndarray
+    :param step: Monte Carlo step of the frame, None if unknown
+    :type step: int
+    :param atoms: structured array of atom records (PDB only)
+    :type atoms: ndarray
+    """
+    def __init__(self, coordinates, cell=None, step=None, atoms=None):
+        self.coordinates = coordinates
+        self.cell = cell
+        self.step = step
+        self.atoms = atoms
+
+    def __len__(self):
+        return len(self.coordinates)
+
+
+class Trajectory:
+    """Streaming reader of GOMC coordinate output, either multi-frame PDB
+    files (e.g. *_BOX_0.pdb written every CoordinatesFreq step) or DCD
+    files. Frames are read one at a time, such that trajectories larger
+    than the available memory can be analyzed. Random access is supported
+    through a frame-offset index built on first use (PDB) or through a
+    memory-mapped frame array (DCD).
+
+    Example:
+        >>> traj = Trajectory("output_BOX_0.pdb")
+        >>> for frame in traj:
+        ...     print(frame.step, frame.coordinates.mean(axis=0))
+        >>> last = traj[-1]
+
+    :param filename: path to trajectory file
+    :type filename: str
+    :param filetype: 'pdb' or 'dcd'. Determined from the file extension by
+        default
+    :type filetype: str
+    """
+    def __init__(self, filename, filetype=None):
+        self.filename = filename
+        if filetype is None:
+            filetype = os.path.splitext(filename)[1][1:].lower()
+        if filetype not in ("pdb", "dcd"):
+            raise NotImplementedError(f"Filetype {filetype} is not supported")
+        self.filetype = filetype
+
+        self._file = open(filename, 'rb')
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b""
+        self._offsets = None
+        if filetype == "dcd":
+            self._open_dcd()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the underlying file."""
+        self._frames = None
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __len__(self):
+        if self.filetype == "dcd":
+            return len(self._frames)
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        if self.filetype == "dcd":
+            for i in range(len(self)):
+                yield self._read_dcd_frame(i)
+        else:
+            for start, stop in self._iter_pdb_bounds():
+                yield self._read_pdb_frame(start, stop)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Frame index out of range")
+        if self.filetype == "dcd":
+            return self._read_dcd_frame(i)
+        return self._read_pdb_frame(self.offsets[i], self.offsets[i+1])
+
+    @property
+    def offsets(self):
+        """Byte offsets of the frames in a PDB trajectory, the last entry
+        being the end of the last frame. Built on first use
+        """
+        if self._offsets is None:
+            bounds = list(self._iter_pdb_bounds())
+            offsets = [start for start, stop in bounds]
+            offsets.append(bounds[-1][1] if bounds else 0)
+            self._offsets = np.asarray(offsets, dtype=np.int64)
+        return self._offsets
+
+    # PDB
+    def _iter_pdb_bounds(self):
+        """Iterate over the byte ranges of all non-empty frames, a frame
+        being terminated by an END (or ENDMDL) record
+        """
+        mm = self._mm
+        start = 0
+        while start < len(mm):
+            stop = mm.find(b"\nEND", start)
+            if stop < 0:
+                stop = len(mm)
+            else:
+                stop = mm.find(b"\n", stop + 1)
+                stop = len(mm) if stop < 0 else stop + 1
+            if mm.find(b"ATOM  ", start, stop) >= 0 \
+                    or mm.find(b"HETATM", start, stop) >= 0:
+                yield start, stop
+            start = stop
+
+    def _read_pdb_frame(self, start, stop):
+        arr = np.frombuffer(self._mm[start:stop], dtype=np.uint8)
+        atoms = _parse_atoms(arr)
+        return Frame(atoms['coordinates'], cell=_parse_cell(arr),
+                     step=_parse_step(arr), atoms=atoms)
+
+    # DCD
+    def _open_dcd(self):
+        mm = self._mm
+        if len(mm) < 4:
+            raise ValueError(f"{self.filename} is not a valid DCD file")
+        endian = '<' if np.frombuffer(mm[:4], dtype='<i4')[0] == 84 else '>'
+        if np.frombuffer(mm[:4], dtype=endian + 'i4')[0] != 84 or mm[4:8] != b"CORD":
+            raise ValueError(f"{self.filename} is not a valid DCD file")
+        icntrl = np.frombuffer(mm[8:88], dtype=endian + 'i4')
+        nfixed = icntrl[8]
+        has_cell = icntrl[10] == 1 and icntrl[19] != 0
+        if nfixed != 0:
+            raise NotImplementedError("DCD files with fixed atoms are not supported")
+        self._nsavc = int(icntrl[2])
+        self._istart = int(icntrl[1])
+
+        # title record and number of atoms record
+        offset = 92
+        titlesize = np.frombuffer(mm[offset:offset+4], dtype=endian + 'i4')[0]
+        offset += titlesize + 8
+        numatoms = np.frombuffer(mm[offset+4:offset+8], dtype=endian + 'i4')[0]
+        offset += 12
+
+        fields = []
+        if has_cell:
+            fields += [('m0', endian + 'i4'), ('cell', endian + 'f8', (6,)),
+                       ('m1', endian + 'i4')]
+        for axis in "xyz":
+            fields += [(axis + '0', endian + 'i4'),
+                       (axis, endian + 'f4', (numatoms,)),
+                       (axis + '1', endian + 'i4')]
+        dtype = np.dtype(fields)
+        numframes = (len(mm) - offset) // dtype.itemsize
+        self._has_cell = has_cell
+        self._frames = np.ndarray((numframes,), dtype=dtype, buffer=mm,
+                                  offset=offset)
+
+    def _read_dcd_frame(self, i):
+        frame = self._frames[i]
+        coordinates = np.stack((frame['x'], frame['y'], frame['z']), axis=1)
+        cell = None
+        if self._has_cell:
+            # CHARMM order is (a, gamma, b, beta, alpha, c), angles are
+            # given either in degrees or as cosines
+            raw = np.asarray(frame['cell'], dtype=np.float64)
+            angles = raw[[4, 3, 1]]
+            if np.all(np.abs(angles) <= 1):
+                angles = np.rad2deg(np.arccos(angles))
+            cell = np.concatenate((raw[[0, 2, 5]], angles))
+        step = self._istart + i * self._nsavc if self._nsavc else None
+        return Frame(coordinates, cell=cell, step=step)
+
+
+def _parse_step(arr):
+    """Parse Monte Carlo step from the GOMC remark of a PDB frame
+    """
+    position = bytes(arr[:min(len(arr), 4096)]).find(b"REMARK")
+    if position < 0:
+        return None
+    line = bytes(arr[position:position + 128]).split(b"\n")[0].split()
+    if len(line) < 2 or line[1] != b"GOMC":
+        return None
+    try:
+        return int(line[-1])
+    except ValueError:
+        return None
+
+
+def iter_frames(filename, filetype=None):
+    """Iterate over all frames of a trajectory, yielding one frame at a
+    time
+
+    :param filename: path to trajectory file
+    :type filename: str
+    """
+    with Trajectory(filename, filetype) as traj:
+        yield from traj
@@ -0,0 +1,164 @@
+import numpy as np
+
+
+def _lookup(table, *atoms):
+    """Look up an internal coordinate given by comma-separated atom labels,
+    in either direction
+    """
+    key = ",".join(atoms)
+    if key in table:
+        return table[key]
+    return table.get(",".join(reversed(atoms)))
+
+
+def _unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _place(A, B, C, bond, angle, dihedral):
+    """Place atoms D given reference atoms A, B and C, the bond length C-D,
+    the angle B-C-D and the dihedral A-B-C-D (Natural Extension Reference
+    Frame). All arguments are arrays over the batch, angles in radians
+    """
+    bc = _unit(C - B)
+    n = _unit(np.cross(B - A, bc))
+    m = np.cross(n, bc)
+    d = np.stack((-bond * np.cos(angle),
+                  bond * np.sin(angle) * np.cos(dihedral),
+                  bond * np.sin(angle) * np.sin(dihedral)), axis=-1)
+    return C + d[:, :1] * bc + d[:, 1:2] * m + d[:, 2:] * n
+
+
+def _angle(A, B, C):
+    """Angle A-B-C in radians over the batch
+    """
+    ba = _unit(A - B)
+    bc = _unit(C - B)
+    return np.arccos(np.clip(np.sum(ba * bc, axis=-1), -1, 1))
+
+
+def build_molecules(bonds, angles={}, dihedrals={}):
+    """Build the geometries of a batch of bonded molecules from internal
+    coordinates. Bond lengths, angles (degrees) and dihedrals (degrees) are
+    given in the same format as the substances, but every value can be
+    either a scalar or an array of length N, such that N candidate
+    geometries are built in one call.
+
+    The first atom is placed in the origin, the second along the x-axis
+    and the third in the xy-plane. Every further atom is placed from its
+    bond, an angle and either a dihedral or a second angle around the same
+    central atom. Atoms without such a constraint are placed trans (180
+    degrees).
+
+    Example:
+        >>> labels, coords = build_molecules(
+        ...     bonds={'O1,H1': 0.9572, 'O1,H2': 0.9572},
+        ...     angles={'H1,O1,H2': np.linspace(100, 110, 11)})
+        >>> coords.shape
+        (11, 3, 3)
+
+    :param bonds: bond lengths, e.g. {'O1,H1': 0.9572}
+    :type bonds: dict
+    :param angles: angles, e.g. {'H1,O1,H2': 104.52}
+    :type angles: dict
+    :param dihedrals: dihedrals, e.g. {'H1,C1,C2,H4': 180.0}
+    :type dihedrals: dict
+    :returns: atom labels and coordinates of shape (N, numatoms, 3)
+    :rtype: tuple
+    """
+    # collect all atoms and their neighbors
+    atoms = {}
+    for bondatoms in bonds.keys():
+        atom1, atom2 = bondatoms.split(",")
+        atoms.setdefault(atom1, []).append(atom2)
+        atoms.setdefault(atom2, []).append(atom1)
+    labels = list(atoms.keys())
+
+    values = list(bonds.values()) + list(angles.values()) + list(dihedrals.values())
+    numbatch = max([np.size(value) for value in values] + [1])
+
+    def batch(value):
+        return np.broadcast_to(np.asarray(value, dtype=float), (numbatch,))
+
+    coordinates = {labels[0]: np.zeros((numbatch, 3))}
+    queue = [labels[0]]
+    while queue:
+        parent = queue.pop(0)
+        for atom in atoms[parent]:
+            if atom in coordinates:
+                continue
+            queue.append(atom)
+            bond = batch(_lookup(bonds, parent, atom))
+            placed = [other for other in coordinates if other != parent]
+
+            # second atom along the x-axis
+            if len(placed) == 0:
+                position = np.zeros((numbatch, 3))
+                position[:, 0] = bond
+                coordinates[atom] = coordinates[parent] + position
+                continue
+
+            # find angle reference among placed atoms
+            refs = [other for other in placed
+                    if _lookup(angles, atom, parent, other) is not None]
+            if len(refs) == 0:
+                raise ValueError(f"No angle defined for atom {atom} around {parent}")
+            ref = refs[0]
+            angle = np.deg2rad(batch(_lookup(angles, atom, parent, ref)))
+            C, B = coordinates[parent], coordinates[ref]
+
+            # third atom in the xy-plane
+            if len(placed) == 1:
+                A = B + np.asarray([0.0, 1.0, 0.0])
+                coordinates[atom] = _place(A, B, C, bond, angle, np.zeros(numbatch))
+                continue
+
+            # dihedral given explicitly
+            dihedral = None
+            for other in placed:
+                value = _lookup(dihedrals, atom, parent, ref, other)
+                if other != ref and value is not None:
+                    A = coordinates[other]
+                    dihedral = np.deg2rad(batch(value))
+                    break
+
+            # dihedral given by a second angle around the same atom
+            if dihedral is None and len(refs) > 1:
+                second = refs[1]
+                A = coordinates[second]
+                angle2 = np.deg2rad(batch(_lookup(angles, atom, parent, second)))
+                between = _angle(A, C, B)
+                cosine = (np.cos(angle2) - np.cos(angle) * np.cos(between)) \
+                    / (np.sin(angle) * np.sin(between))
+                dihedral = np.arccos(np.clip(cosine, -1, 1))
+
+                # the sign of the dihedral is given by a third angle if
+                # present, otherwise the position furthest away from the
+                # other placed atoms is chosen
+                plus = _place(A, B, C, bond, angle, dihedral)
+                minus = _place(A, B, C, bond, angle, -dihedral)
+                if len(refs) > 2:
+                    third = coordinates[refs[2]]
+                    target = np.deg2rad(batch(_lookup(angles, atom, parent, refs[2])))
+                    use_plus = np.abs(_angle(plus, C, third) - target) \
+                        <= np.abs(_angle(minus, C, third) - target)
+                else:
+                    others = np.stack([coordinates[other] for other in placed], axis=1)
+                    distance_plus = np.linalg.norm(others - plus[:, np.newaxis], axis=-1)
+                    distance_minus = np.linalg.norm(others - minus[:, np.newaxis], axis=-1)
+                    use_plus = distance_plus.min(axis=1) >= distance_minus.min(axis=1)
+                coordinates[atom] = np.where(use_plus[:, np.newaxis], plus, minus)
+                continue
+
+            # default to trans, with respect to a neighbor of the reference
+            # atom such that the dihedral is along the bonds
+            if dihedral is None:
+                others = [other for other in atoms[ref]
+                          if other != parent and other in coordinates]
+                others += [other for other in placed if other != ref]
+                A = coordinates[others[0]]
+                dihedral = np.full(numbatch, np.pi)
+
+            coordinates[atom] = _place(A, B, C, bond, angle, dihedral)
+
+    return labels, np.stack([coordinates[label] for label in labels], axis=1)
@@ -0,0 +1,160 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from gomc_wrapper.analyze import Blk, FreeEnergy, read_table, read_cached_table, statistics
+
+
+def write_table(filename, columns, numrows, info=()):
+    """Write a GOMC output table with random data"""
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(numrows, len(columns))) * 1e3
+    data[:, 0] = np.arange(1, numrows + 1) * 1000
+    with open(filename, 'w') as f:
+        for line in info:
+            f.write(f"#{line}\n")
+        f.write("#" + "".join(f"{column:>16}" for column in columns) + "\n")
+        for row in data:
+            f.write(" " + "".join(f"{value:16.6e}" for value in row) + "\n")
+
+
+def read_pandas(filename, numinfo=0):
+    """Parse a table like Blk and FreeEnergy used to, through pandas"""
+    with open(filename) as f:
+        for _ in range(numinfo):
+            f.readline()
+        string = f.readline()[1:]
+        return pd.read_table(io.StringIO(string + f.read()), sep=r'\s+')
+
+
+COLUMNS = ["STEPS", "TOT_EN", "EN_INTER", "TOT_DENSITY", "PRESSURE"]
+
+
+def test_blk(tmp_path):
+    filename = tmp_path / "Blk_out_BOX_0.dat"
+    write_table(filename, COLUMNS, 100)
+    reference = read_pandas(filename)
+    blk = Blk(str(filename))
+    assert blk.keywords == COLUMNS
+    for column in COLUMNS:
+        assert np.array_equal(blk.find(column), reference[column].to_numpy())
+    assert np.array_equal(blk.to_array(), reference.to_numpy())
+    assert blk.contents.equals(reference)
+
+    # columns not read initially are read on first access
+    blk = Blk(str(filename), usecols=["TOT_DENSITY"], dtype=np.float32)
+    assert list(blk.data) == ["TOT_DENSITY"]
+    assert blk.find("PRESSURE").dtype == np.float32
+    assert np.allclose(blk.find("PRESSURE"), reference["PRESSURE"], rtol=1e-6)
+    with pytest.raises(KeyError):
+        Blk(str(filename), usecols=["VOLUME"])
+
+
+def test_free_energy(tmp_path):
+    filename = tmp_path / "Free_Energy_BOX_0_out.dat"
+    info = ["T(K):     298.000000  State_VDW:  2  Lambda_VDW:  0.5"]
+    columns = ["STEPS", "dU/dL", "DelE_State_0", "DelE_State_1", "PV"]
+    write_table(filename, columns, 50, info)
+    reference = read_pandas(filename, numinfo=1)
+    with open(filename) as f:
+        fe = FreeEnergy(f)
+    assert fe.info == info
+    assert fe.keywords == columns
+    assert fe.contents.equals(reference)
+
+
+def test_empty_table(tmp_path):
+    filename = tmp_path / "Blk_out_BOX_0.dat"
+    write_table(filename, COLUMNS, 0)
+    info, keywords, data = read_table(str(filename))
+    assert keywords == COLUMNS
+    assert all(len(column) == 0 for column in data.values())
+
+
+def assert_same(table, reference):
+    info, keywords, data = table
+    assert (info, keywords) == reference[:2]
+    assert list(data) == list(reference[2])
+    for column in data:
+        assert np.array_equal(data[column], reference[2][column])
+
+
+def test_cached_table(tmp_path):
+    filename = str(tmp_path / "Blk_out_BOX_0.dat")
+    write_table(filename, COLUMNS, 100)
+    assert_same(read_cached_table(filename, ["TOT_EN"]),
+                read_table(filename, ["TOT_EN"]))
+    assert os.path.isfile(tmp_path / ".Blk_out_BOX_0.dat.npcache" / "index.json")
+
+    # cached columns are memory-mapped, the others are parsed and added
+    data = read_cached_table(filename)[2]
+    assert isinstance(data["TOT_EN"], np.memmap)
+    assert not isinstance(data["PRESSURE"], np.memmap)
+    assert all(isinstance(column, np.memmap)
+               for column in read_cached_table(filename)[2].values())
+    assert_same(read_cached_table(filename), read_table(filename))
+    assert all(np.array_equal(Blk(filename).find(column),
+                              Blk(filename, cache=False).find(column))
+               for column in COLUMNS)
+
+
+def test_cached_table_invalidated(tmp_path):
+    filename = str(tmp_path / "Blk_out_BOX_0.dat")
+    write_table(filename, COLUMNS, 100)
+    read_cached_table(filename)
+
+    # the simulation has written more rows
+    write_table(filename, COLUMNS, 120)
+    data = read_cached_table(filename)[2]
+    assert not isinstance(data["TOT_EN"], np.memmap)
+    assert_same(read_cached_table(filename), read_table(filename))
+    assert len(read_cached_table(filename)[2]["TOT_EN"]) == 120
+
+    # same size, but modified since
+    with open(filename, 'r') as f:
+        text = f.read()
+    i = text.rindex("e+0")
+    with open(filename, 'w') as f:
+        f.write(text[:i] + "e-0" + text[i + 3:])
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert_same(read_cached_table(filename), read_table(filename))
+
+
+def ar1(phi, numsamples, seed=0):
+    """Columns of AR(1) processes x_t = phi x_(t-1) + e_t with unit noise,
+    started from their stationary distribution
+    """
+    phi = np.asarray(phi)
+    noise = np.random.default_rng(seed).normal(size=(numsamples, len(phi)))
+    x = np.empty_like(noise)
+    x[0] = noise[0] / np.sqrt(1 - phi**2)
+    for t in range(1, numsamples):
+        x[t] = phi * x[t - 1] + noise[t]
+    return x
+
+
+@pytest.mark.parametrize("method", ["autocorrelation", "blocking"])
+def test_statistics_ar1(method):
+    # the statistical inefficiency of AR(1) is (1 + phi) / (1 - phi), and
+    # its variance 1 / (1 - phi^2)
+    phi = np.array([0.0, 0.5, 0.9])
+    numsamples = 1 << 16
+    x = ar1(phi, numsamples)
+    inefficiency = (1 + phi) / (1 - phi)
+    expected = np.sqrt(inefficiency / (1 - phi**2) / numsamples)
+    mean, error, neff = statistics(x, method)
+    assert np.allclose(error, expected, rtol=0.15)
+    assert np.allclose(neff, numsamples / inefficiency, rtol=0.2)
+    assert np.all(np.abs(mean) < 4 * expected)
+    assert np.isclose(statistics(x[:, 2], method)[1], error[2])
+
+
+def test_blocking_short_series():
+    # 256 samples of a series with a correlation time of about 100 samples
+    x = ar1([0.99, 0.0], 256)
+    with pytest.warns(RuntimeWarning):
+        mean, error, neff = statistics(x, 'blocking')
+    assert np.isnan(error[0]) and np.isnan(neff[0])
+    assert np.isfinite(error[1])
@@ -0,0 +1,61 @@
+import os
+import pytest
+from gomc_wrapper import GOMC, ConfigurationCache
+from gomc_wrapper.substance import TIP4P2005
+
+
+def read_entry(directory):
+    """Contents of all files in a cache directory"""
+    contents = {}
+    for root, _, files in os.walk(directory):
+        for file in files:
+            with open(os.path.join(root, file), 'rb') as f:
+                contents[os.path.join(root, file)] = f.read()
+    return contents
+
+
+def test_key(tmp_path):
+    molecule = tmp_path / "molecule.pdb"
+    molecule.write_text("REMARK   first\nATOM      1 O1   TIP4    1       0.000   0.000   0.000\n")
+    cache = ConfigurationCache(tmp_path / "cache")
+    key = cache.key(molecule, 100, 15.0, seed=1)
+    molecule.write_text("REMARK   second\nATOM      1 O1   TIP4    1       0.000   0.000   0.000\n")
+    assert cache.key(molecule, 100, 15.0000001, seed=1) == key
+    assert cache.key(molecule, 101, 15.0, seed=1) != key
+    assert cache.key(molecule, 100, 15.0, seed=2) != key
+    assert cache.key(molecule, 100, 15.0, seed=1, packer='lattice') != key
+
+
+def test_store_and_fetch(tmp_path):
+    cache = ConfigurationCache(tmp_path / "cache")
+    source = tmp_path / "source.pdb"
+    source.write_text("coordinates\n")
+    assert not cache.fetch("key", tmp_path / "fetched.pdb")
+    cache.store("key", source)
+    # the cache keeps its own copy of stored files
+    source.write_text("modified\n")
+    assert cache.fetch("key", tmp_path / "fetched.pdb")
+    assert (tmp_path / "fetched.pdb").read_text() == "coordinates\n"
+
+
+@pytest.mark.parametrize("link", [False, True])
+def test_miss_after_hit_leaves_entry(tmp_path, monkeypatch, link):
+    monkeypatch.chdir(tmp_path)
+    cache = ConfigurationCache(tmp_path / "cache", link=link)
+    kwargs = dict(numberdensity=0.0334, packer='lattice', seed=1, cache=cache)
+
+    GOMC().set_box(0, 100, TIP4P2005(), **kwargs)
+    entries = read_entry(cache.directory)
+    assert len(entries) == 2
+
+    # hit
+    GOMC().set_box(0, 100, TIP4P2005(), **kwargs)
+    assert read_entry(cache.directory) == entries
+
+    # miss writing to the same files
+    GOMC().set_box(0, 50, TIP4P2005(), **kwargs)
+    new_entries = read_entry(cache.directory)
+    assert len(new_entries) == 4
+    assert all(new_entries[file] == content for file, content in entries.items())
+    with open("box_0.pdb") as f:
+        assert sum(line.startswith("ATOM") for line in f) == 50 * 4
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from gomc_wrapper.packer import pack
+
+WATER = np.array([[0.0, 0.0, 0.0], [0.957, 0.0, 0.0], [-0.240, 0.927, 0.0],
+                  [0.095, 0.122, 0.0]])
+
+
+def min_distance(packed):
+    """Smallest distance between atoms of different molecules"""
+    nummol, numatoms, _ = packed.shape
+    atoms = packed.reshape(-1, 3)
+    owners = np.repeat(np.arange(nummol), numatoms)
+    distances = np.linalg.norm(atoms[:, np.newaxis] - atoms[np.newaxis], axis=-1)
+    distances[owners[:, np.newaxis] == owners[np.newaxis]] = np.inf
+    return distances.min()
+
+
+@pytest.mark.parametrize("method,volume", [("lattice", 29.9), ("random", 60.0)])
+def test_pack(method, volume):
+    nummol = 300
+    length = (nummol * volume)**(1/3)
+    packed = pack(WATER, nummol, length, tolerance=2.0, method=method, seed=1)
+    assert packed.shape == (nummol, 4, 3)
+    assert packed.min() >= 0 and packed.max() <= length
+    assert min_distance(packed) >= 2.0
+
+
+def test_random_packing_fails_fast_at_liquid_density():
+    nummol = 10000
+    with pytest.raises(ValueError):
+        pack(WATER, nummol, (nummol * 29.9)**(1/3), method='random')
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from gomc_wrapper.pdbfile import read_pdb, iter_pdb, count_atoms, read_cell
+
+
+def record(serial, name, resname, resid, x, y, z):
+    """ATOM record with fixed-width columns, and asterisks for numbers that
+    do not fit their column, like Packmol writes them
+    """
+    serial = "*****" if serial > 99999 else serial
+    resid = "****" if resid > 9999 else resid
+    return "ATOM  {:>5} {:<4} {:<4}{:>5}    {:8.3f}{:8.3f}{:8.3f}  1.00  0.00\n" \
+        .format(serial, name, resname, resid, x, y, z)
+
+
+def write_molecules(filename, molecules):
+    """Write consecutive molecules given as (resname, atom names) pairs"""
+    serial = 0
+    with open(filename, 'w') as f:
+        f.write("CRYST1   30.000   30.000   30.000  90.00  90.00  90.00 P 1           1\n")
+        for resid, (resname, names) in enumerate(molecules, start=1):
+            for name in names:
+                serial += 1
+                f.write(record(serial, name, resname, resid, serial * 1e-3,
+                               -1.0, 2.5))
+        f.write("END\n")
+    return np.concatenate([np.full(len(names), resid) for resid, (_, names)
+                           in enumerate(molecules, start=1)])
+
+
+def test_fixed_width_columns(tmp_path):
+    filename = tmp_path / "atoms.pdb"
+    filename.write_text(
+        "REMARK   test\n"
+        "CRYST1   10.000   20.000   30.000  90.00  90.00 120.00 P 1           1\n"
+        "ATOM      1 O1   TIP4    1    -123.456-234.567-345.678  1.00  0.00           O\n"
+        "HETATM    2 H1   TIP4    1       1.000   2.000   3.000  0.50  1.00           H\n"
+        "TER\n"
+        "ATOM      3 C1   MET     2       4.000   5.000   6.000\n"
+        "END\n")
+    pdb = read_pdb(str(filename))
+    assert len(pdb) == 3
+    assert list(pdb.names) == ["O1", "H1", "C1"]
+    assert list(pdb.atoms['resname']) == ["TIP4", "TIP4", "MET"]
+    assert list(pdb.resids) == [1, 1, 2]
+    assert np.allclose(pdb.coordinates[0], [-123.456, -234.567, -345.678])
+    assert np.allclose(pdb.atoms['occupancy'], [1.0, 0.5, 0.0])
+    assert list(pdb.atoms['element']) == ["O", "H", ""]
+    assert np.allclose(pdb.cell, [10, 20, 30, 90, 90, 120])
+    assert np.allclose(read_cell(str(filename)), pdb.cell)
+    assert count_atoms(str(filename)) == 3
+    assert read_pdb(filename.read_bytes()).resids.tolist() == [1, 1, 2]
+
+
+def test_serial_overflow(tmp_path):
+    filename = tmp_path / "atoms.pdb"
+    resids = write_molecules(filename, 40001 * [("TIP4", ["O1", "H1", "H2"])])
+    pdb = read_pdb(str(filename))
+    assert np.array_equal(pdb.serials, np.arange(1, len(resids) + 1))
+
+
+def test_resid_overflow(tmp_path):
+    # molecules beyond 9999 share the residue ID '****'. A second species
+    # starting beyond 9999 and a species whose atoms share the first name
+    # are numbered by the size of their earlier molecules
+    molecules = 5 * [("ETH", ["C", "C"])] \
+        + 10100 * [("TIP4", ["O1", "H1", "H2", "M1"])] \
+        + 30 * [("MET", ["C1", "H1", "H2", "H3", "H4"])] \
+        + 20 * [("ETH", ["C", "C"])]
+    filename = tmp_path / "atoms.pdb"
+    resids = write_molecules(filename, molecules)
+    assert np.array_equal(read_pdb(str(filename)).resids, resids)
+
+
+@pytest.mark.parametrize("chunksize,blocksize", [(7, 4096), (1000, 4096),
+                                                 (100000, 1 << 24)])
+def test_iter_pdb(tmp_path, chunksize, blocksize):
+    molecules = 5 * [("ETH", ["C", "C"])] \
+        + 10100 * [("TIP4", ["O1", "H1", "H2", "M1"])] \
+        + 30 * [("MET", ["C1", "H1", "H2", "H3", "H4"])]
+    filename = tmp_path / "atoms.pdb"
+    resids = write_molecules(filename, molecules)
+    whole = read_pdb(str(filename)).atoms
+    chunks = [chunk.copy() for chunk in iter_pdb(str(filename), chunksize,
+                                                 blocksize=blocksize)]
+    assert all(len(chunk) == chunksize for chunk in chunks[:-1])
+    merged = np.concatenate(chunks)
+    assert np.array_equal(merged['resid'], resids)
+    assert np.array_equal(merged['serial'], whole['serial'])
+    assert np.array_equal(merged['coordinates'], whole['coordinates'])
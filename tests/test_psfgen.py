@@ -0,0 +1,69 @@
+import os
+import shutil
+import pytest
+from gomc_wrapper.file_handling import psfgen
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+def read_psf(filename):
+    """Lines of a PSF file without the time-stamped remark"""
+    with open(filename) as f:
+        return [line for line in f if "DATE:" not in line]
+
+
+def split_angles(lines):
+    """Split the lines of a PSF file into the angles, as a sorted list of
+    triplets with the outer atoms in ascending order, and the other lines
+    """
+    start = next(i for i, line in enumerate(lines) if "!NTHETA" in line) + 1
+    stop = lines.index("\n", start)
+    indices = [int(index) for line in lines[start:stop] for index in line.split()]
+    angles = sorted((min(a, c), b, max(a, c)) for a, b, c in
+                    zip(indices[0::3], indices[1::3], indices[2::3]))
+    return angles, lines[:start] + lines[stop:]
+
+
+@pytest.fixture
+def inputs(tmp_path, monkeypatch):
+    for file in ("tip4p.pdb", "tip4p.inp"):
+        shutil.copyfile(os.path.join(DATA, file), tmp_path / file)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_psfgen_matches_reference(inputs):
+    # tip4p.psf was written by the original psfgen, with a fixed list of
+    # water angles. The angles are generated from the bonds now, in another
+    # order
+    psfgen("tip4p.pdb", "tip4p.inp", genfile="tip4p.psf")
+    angles, lines = split_angles(read_psf("tip4p.psf"))
+    ref_angles, ref_lines = split_angles(read_psf(os.path.join(DATA, "tip4p.psf")))
+    assert lines == ref_lines
+    assert angles == ref_angles
+
+
+def write_waters(filename, nummols):
+    """Write a Packmol-style PDB file of 'nummols' TIP4P molecules"""
+    atoms = [("O1", 0.0, 0.0, 0.0), ("H1", 0.957, 0.0, 0.0),
+             ("H2", -0.240, 0.927, 0.0), ("M1", 0.095, 0.122, 0.0)]
+    with open(filename, 'w') as f:
+        f.write("REMARK   Packmol generated pdb file\n")
+        f.write("REMARK   Home-Page: http://m3g.iqm.unicamp.br/packmol\n")
+        f.write("REMARK\n")
+        serial = 1
+        for mol in range(nummols):
+            for name, x, y, z in atoms:
+                f.write("ATOM  %5d %-4s TIP4 %5d    %8.3f%8.3f%8.3f  1.00  0.00"
+                        "          %2s\n" % (serial, name, mol + 1, x + mol,
+                                             y, z, name[0]))
+                serial += 1
+        f.write("END\n")
+
+
+@pytest.mark.parametrize("chunksize", [1, 200, 1000])
+def test_chunked_psfgen_matches_whole(inputs, chunksize):
+    write_waters("waters.pdb", 100)
+    psfgen("waters.pdb", "tip4p.inp", genfile="whole.psf")
+    psfgen("waters.pdb", "tip4p.inp", genfile="chunked.psf", chunksize=chunksize)
+    assert read_psf("chunked.psf") == read_psf("whole.psf")
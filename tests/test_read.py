@@ -0,0 +1,49 @@
+import os
+import pytest
+from gomc_wrapper import file_handling
+from gomc_wrapper.file_handling import read, read_tree
+
+
+def write_conf(filename, temperature):
+    with open(filename, 'w') as f:
+        f.write("# comment\n"
+                f"Temperature {temperature}  # inline comment\n"
+                "1-4scaling 0.5\n"
+                "UnknownKeyword 1\n")
+
+
+def temperature(gomc):
+    return float(gomc.parameters.get("Temperature").values[0])
+
+
+def test_read(tmp_path):
+    write_conf(tmp_path / "in.conf", 300)
+    gomc = read(tmp_path / "in.conf")
+    assert temperature(gomc) == 300
+    assert float(gomc.parameters.get("1-4scaling").values[0]) == 0.5
+
+
+def test_invalid_value(tmp_path):
+    (tmp_path / "in.conf").write_text("Temperature hot\n")
+    with pytest.raises(ValueError, match="in.conf:1"):
+        read(tmp_path / "in.conf")
+
+
+def test_cache_invalidation(tmp_path):
+    filename = tmp_path / "in.conf"
+    write_conf(filename, 300)
+    assert temperature(read(filename)) == 300
+    write_conf(filename, 3000)
+    assert temperature(read(filename)) == 3000
+
+
+def test_cache_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handling, "_PARSE_CACHE_SIZE", 4)
+    for i in range(10):
+        os.makedirs(tmp_path / f"job{i}")
+        write_conf(tmp_path / f"job{i}" / "in.conf", 300 + i)
+    configs = read_tree(tmp_path)
+    assert len(configs) == 10
+    assert [temperature(configs[os.path.join(tmp_path, f"job{i}", "in.conf")])
+            for i in range(10)] == [300 + i for i in range(10)]
+    assert len(file_handling._parsed) <= 4
@@ -0,0 +1,71 @@
+import os
+import pytest
+from gomc_wrapper import GOMC
+from gomc_wrapper.results import config_hash, ResultStore
+
+
+@pytest.fixture
+def wd(tmp_path):
+    wd = tmp_path / "job"
+    wd.mkdir()
+    (wd / "param.inp").write_text("* parameters\nBONDS\n")
+    (wd / "box_0.pdb").write_text("REMARK   packed\nATOM      1 O1   TIP4    1\n")
+    (wd / "box_0.psf").write_text("PSF\n")
+    return wd
+
+
+def make_gomc(wd, order=1, coordinates="box_0.pdb"):
+    settings = [("Parameters", "param.inp"), ("Coordinates", 0, coordinates),
+                ("Coordinates", 1, coordinates), ("Structure", 0, "box_0.psf"),
+                ("Temperature", 300), ("RunSteps", 1000)]
+    gomc = GOMC()
+    gomc.set_working_directory(str(wd), overwrite=True)
+    for setting in settings[::order]:
+        gomc.set(*setting)
+    return gomc
+
+
+def test_order_independent(wd):
+    assert config_hash(make_gomc(wd)) == config_hash(make_gomc(wd, order=-1))
+    assert config_hash(make_gomc(wd), "GOMC_CPU_NVT") \
+        != config_hash(make_gomc(wd), "GOMC_CPU_NPT")
+    gomc = make_gomc(wd)
+    gomc.set("Temperature", 310)
+    assert config_hash(gomc) != config_hash(make_gomc(wd))
+
+
+def test_file_content(wd):
+    key = config_hash(make_gomc(wd))
+    # remarks do not identify the simulation
+    (wd / "box_0.pdb").write_text("REMARK   repacked\nATOM      1 O1   TIP4    1\n")
+    assert config_hash(make_gomc(wd)) == key
+    (wd / "box_0.pdb").write_text("REMARK   packed\nATOM      1 O1   TIP4    2\n")
+    assert config_hash(make_gomc(wd)) != key
+
+
+def test_absolute_paths(wd):
+    gomc = make_gomc(wd, coordinates=str(wd / "box_0.pdb"))
+    key = config_hash(gomc)
+    assert key is not None
+    (wd / "box_0.pdb").write_text("ATOM      1 O1   TIP4    2\n")
+    assert config_hash(gomc) != key
+
+
+def test_missing_file(wd):
+    os.remove(wd / "box_0.psf")
+    assert config_hash(make_gomc(wd)) is None
+
+
+def test_result_store(tmp_path, wd):
+    store = ResultStore(tmp_path / "store")
+    assert store.lookup("key") is None
+    store.store("key", wd, [wd / "out.dat"])
+    result = store.lookup("key")
+    assert result['directory'] == str(wd)
+    assert result['outputs'] == [str(wd / "out.dat")]
+    store.remove("key")
+    assert store.lookup("key") is None
+
+    # results whose output has been removed are not found
+    store.store("key", tmp_path / "removed")
+    assert store.lookup("key") is None
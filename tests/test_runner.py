@@ -0,0 +1,84 @@
+import os
+import sys
+import stat
+import pytest
+from gomc_wrapper import GOMC
+from gomc_wrapper.console import ConsoleParser, EquilibrationDetector
+from gomc_wrapper.runner import _stream, _production
+
+# fake GOMC printing an energy record every step and writing restart files
+# every RestartFreq steps, and at step 0 before printing anything
+FAKE_GOMC = """#!{python}
+import sys
+import time
+conf = {{}}
+with open(sys.argv[-1]) as f:
+    for line in f:
+        tokens = line.split()
+        if tokens and not tokens[0].startswith("#"):
+            conf[tokens[0]] = tokens[1:]
+name = conf["OutputName"][0]
+freq = int(conf["RestartFreq"][1])
+print("ETITLE:     STEP     TOTAL", flush=True)
+for step in range(int(conf["RunSteps"][0]) + 1):
+    if step % freq == 0:
+        for ext in ("pdb", "psf"):
+            with open(f"{{name}}_BOX_0_restart.{{ext}}", "w") as f:
+                f.write(f"{{step}}\\n")
+        time.sleep(0.02)
+    if step > 0:
+        print(f"ENER_0:     {{step}}     {{-100 + 0.1 * (-1)**step}}", flush=True)
+        time.sleep(0.02)
+"""
+
+
+@pytest.fixture
+def gomc(tmp_path):
+    executable = tmp_path / "GOMC_CPU_NVT"
+    executable.write_text(FAKE_GOMC.format(python=sys.executable))
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+
+    gomc = GOMC()
+    gomc.set_working_directory(tmp_path / "job")
+    gomc.set("Coordinates", 0, "box_0.pdb")
+    gomc.set("Structure", 0, "box_0.psf")
+    gomc.set("OutputName", "equil")
+    gomc.set("RestartFreq", True, 20)
+    gomc.set("EqSteps", 50)
+    gomc.set("RunSteps", 60)
+    gomc.write("in.conf")
+    return gomc, str(executable)
+
+
+def test_stop_after_restart_in_window(gomc):
+    # equilibrium is detected at step 5, but the only restart files are
+    # from step 0, before the equilibrated window
+    gomc, executable = gomc
+    console = ConsoleParser()
+    popen, stopped = _stream(gomc, [executable, "in.conf"], console,
+                             EquilibrationDetector(window=5))
+    assert stopped == 20
+    with open(os.path.join(gomc.wd, "equil_BOX_0_restart.pdb")) as f:
+        assert f.read() == "20\n"
+
+
+def test_production(gomc):
+    gomc, executable = gomc
+    production = _production(gomc)
+    values = lambda keyword: production.parameters.get(keyword).values
+    assert values("Restart") == [True]
+    assert values("Coordinates") == {0: [0, "equil_BOX_0_restart.pdb"]}
+    assert values("Structure") == {0: [0, "equil_BOX_0_restart.psf"]}
+    assert values("OutputName") == ["equil_prod"]
+    assert values("RunSteps") == [10]
+    assert values("EqSteps") == [0]
+
+    console = ConsoleParser()
+    gomc.run(executable, console=console, detector=EquilibrationDetector(window=5))
+    assert os.path.isfile(os.path.join(gomc.wd, "in_prod.conf"))
+    with open(os.path.join(gomc.wd, "equil_prod_BOX_0_restart.pdb")) as f:
+        assert f.read() == "0\n"
+    # records of the stopped run up to step 20 and of the production run
+    steps = console.series("ENER", "STEP")
+    assert list(steps[-10:]) == list(range(1, 11))
+    assert 20 <= steps[-11] < 50
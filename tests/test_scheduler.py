@@ -0,0 +1,19 @@
+import os
+import pytest
+from gomc_wrapper.scheduler import LocalScheduler, _available_cores
+
+
+def test_default_cores():
+    assert LocalScheduler().cores == _available_cores()
+
+
+@pytest.mark.parametrize("cores", [[], [os.cpu_count() + 64], [-1]])
+def test_unavailable_cores(cores):
+    with pytest.raises(ValueError):
+        LocalScheduler(cores)
+
+
+def test_oversized_job():
+    scheduler = LocalScheduler()
+    with pytest.raises(ValueError):
+        scheduler.submit(None, num_procs=len(scheduler.cores) + 1)
@@ -0,0 +1,207 @@
+import os
+import stat
+import subprocess
+import pytest
+from gomc_wrapper import GOMC, SlurmTracker, submit_array
+
+# fake sbatch logging the job script and its array range, and printing a
+# new job ID on every call
+SBATCH = """#!/bin/bash
+count=$(cat {log} 2>/dev/null | wc -l)
+echo "$(pwd)/$1 $(grep -- '--array=' $1 | sed 's/.*--array=//')" >> {log}
+echo "Submitted batch job $((1000 + count))"
+"""
+
+
+def install(bindir, name, script):
+    executable = bindir / name
+    executable.write_text(script)
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture
+def bindir(tmp_path, monkeypatch):
+    """Directory of fake Slurm commands, the only directory on PATH besides
+    the one of bash and the core utilities
+    """
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}/usr/bin{os.pathsep}/bin")
+    return bindir
+
+
+@pytest.fixture
+def sbatch(tmp_path, bindir):
+    log = tmp_path / "sbatch.log"
+    install(bindir, "sbatch", SBATCH.format(log=log))
+    return log
+
+
+def make_jobs(directory, numjobs):
+    jobs = []
+    for i in range(numjobs):
+        gomc = GOMC()
+        gomc.set("Temperature", 280 + i)
+        gomc.set_working_directory(os.path.join(directory, f"job{i:04d}"))
+        jobs.append(gomc)
+    return jobs
+
+
+def submissions(log):
+    return [line.split() for line in log.read_text().splitlines()]
+
+
+def test_submit_array(tmp_path, sbatch):
+    jobs = make_jobs(tmp_path / "sweep", 3)
+    array = submit_array(jobs, num_procs=4, slurm_args={'time': '01:00:00'},
+                         max_concurrent=2)
+
+    directory = str(tmp_path / "sweep")
+    assert submissions(sbatch) == [[os.path.join(directory, "array.sh"), "0-2%2"]]
+    assert array.job_ids == [1000]
+    assert array.task_ids == ["1000_0", "1000_1", "1000_2"]
+    assert array.directories == [job.wd for job in jobs]
+    assert array[1] is jobs[1]
+
+    tasklist = os.path.join(directory, "array.sh.tasks")
+    with open(tasklist) as f:
+        assert f.read().split() == [job.wd for job in jobs]
+    with open(os.path.join(directory, "array.sh")) as f:
+        script = f.read()
+    assert "#SBATCH --time=01:00:00" in script
+    assert f'"{tasklist}"' in script
+    assert "GOMC_CPU_NVT +p4 in.conf" in script
+    for job in jobs:
+        assert os.path.isfile(os.path.join(job.wd, "in.conf"))
+
+
+def test_array_script_changes_to_task_directory(tmp_path, sbatch):
+    jobs = make_jobs(tmp_path / "sweep", 3)
+    submit_array(jobs, gomc_exec="pwd")
+    script = os.path.join(tmp_path, "sweep", "array.sh")
+    # run from another directory, like with the chdir option
+    output = subprocess.check_output(["bash", script], cwd=tmp_path,
+                                     env=dict(os.environ, SLURM_ARRAY_TASK_ID="2"))
+    assert output.decode().strip() == jobs[2].wd
+
+
+def test_split_large_arrays(tmp_path, sbatch):
+    jobs = make_jobs(tmp_path / "sweep", 7)
+    array = submit_array(jobs, gomc_exec="pwd", max_array_size=3)
+
+    directory = str(tmp_path / "sweep")
+    assert submissions(sbatch) == [
+        [os.path.join(directory, "array_0.sh"), "0-2"],
+        [os.path.join(directory, "array_1.sh"), "0-2"],
+        [os.path.join(directory, "array_2.sh"), "0-0"]]
+    assert array.job_ids == [1000, 1001, 1002]
+    assert array.task_id(4) == "1001_1"
+    assert array.task_id(6) == "1002_0"
+
+    # task 1 of the second array runs job 4
+    script = os.path.join(directory, "array_1.sh")
+    output = subprocess.check_output(["bash", script], cwd=tmp_path,
+                                     env=dict(os.environ, SLURM_ARRAY_TASK_ID="1"))
+    assert output.decode().strip() == jobs[4].wd
+
+
+def test_tracker_raises_without_squeue(bindir):
+    tracker = SlurmTracker(interval=0.01)
+    future = tracker.track(1234)
+    with pytest.raises(RuntimeError):
+        tracker.wait(timeout=5)
+
+    tracker.start()
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+
+
+def test_tracker_raises_after_failures(bindir):
+    install(bindir, "squeue", "#!/bin/bash\nexit 1\n")
+    tracker = SlurmTracker(interval=0.01, max_failures=3)
+    tracker.track(1234)
+    assert not tracker.poll()
+    assert not tracker.poll()
+    with pytest.raises(RuntimeError):
+        tracker.poll()
+
+
+def test_tracker_grace_period(bindir):
+    # the job has left the queue, but is not in the accounting database yet
+    install(bindir, "squeue", "#!/bin/bash\n")
+    install(bindir, "sacct", "#!/bin/bash\n")
+    tracker = SlurmTracker(interval=0.01, grace=3600)
+    future = tracker.track(1234)
+    assert not tracker.wait(timeout=0.1)
+    assert not future.done()
+
+    install(bindir, "sacct", "#!/bin/bash\necho '1234|COMPLETED'\n")
+    assert tracker.wait(timeout=5)
+    assert future.result() == "COMPLETED"
+
+    install(bindir, "sacct", "#!/bin/bash\n")
+    tracker = SlurmTracker(interval=0.01, grace=0)
+    future = tracker.track(1234)
+    assert tracker.wait(timeout=5)
+    assert future.result() == "UNKNOWN"
+
+
+def test_run_does_not_wait_for_slurm_by_default(tmp_path, sbatch):
+    # without squeue on PATH, tracking the job would raise
+    gomc = GOMC()
+    gomc.set_working_directory(tmp_path / "job")
+    assert gomc.run(slurm=True) == 1000
+
+
+def test_run_timeout(tmp_path, sbatch, bindir):
+    install(bindir, "squeue", "#!/bin/bash\necho '1000|RUNNING'\n")
+    gomc = GOMC()
+    gomc.set_working_directory(tmp_path / "job")
+    with pytest.raises(TimeoutError):
+        gomc.run(slurm=True, wait=True, timeout=0.1)
+
+
+# fake sbatch logging the job script and its dependency
+SBATCH_DEPENDENCY = """#!/bin/bash
+count=$(cat {log} 2>/dev/null | wc -l)
+echo "$1 $(grep -- '--dependency=' $1 | sed 's/.*--dependency=//')" >> {log}
+echo "Submitted batch job $((1000 + count))"
+"""
+
+# fake squeue printing the states of the requested job found in {states}
+SQUEUE_STATES = """#!/bin/bash
+while [ $# -gt 0 ]; do
+    [ "$1" = "-j" ] && grep "^$2|" {states} | cut -d'|' -f2
+    shift
+done
+exit 0
+"""
+
+
+def test_run_segments_resubmits_chain(tmp_path, bindir):
+    log = tmp_path / "sbatch.log"
+    states = tmp_path / "states"
+    scancel = tmp_path / "scancel.log"
+    install(bindir, "sbatch", SBATCH_DEPENDENCY.format(log=log))
+    install(bindir, "squeue", SQUEUE_STATES.format(states=states))
+    install(bindir, "scancel", f"#!/bin/bash\necho $1 >> {scancel}\n")
+
+    gomc = GOMC()
+    gomc.set_working_directory(tmp_path / "job")
+    gomc.set("OutputName", "run")
+    gomc.set("RunSteps", 30)
+    assert gomc.run_segments(10, slurm=True) == [1000, 1001, 1002]
+    assert submissions(log) == [["job_0.sh"], ["job_1.sh", "afterok:1000"],
+                                ["job_2.sh", "afterok:1001"]]
+
+    # nothing is submitted while the chain is intact
+    states.write_text("1000|RUNNING\n1001|PENDING\n1002|PENDING\n")
+    assert gomc.run_segments(10, slurm=True) == []
+    assert not scancel.exists()
+
+    # the first segment failed, and its dependants would never start
+    states.write_text("1001|PENDING\n1002|PENDING\n")
+    assert gomc.run_segments(10, slurm=True) == [1003, 1004, 1005]
+    assert scancel.read_text().split() == ["1001", "1002"]
+    assert submissions(log)[3:] == [["job_0.sh"], ["job_1.sh", "afterok:1003"],
+                                    ["job_2.sh", "afterok:1004"]]
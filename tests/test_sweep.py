@@ -0,0 +1,61 @@
+import os
+import json
+import pytest
+from gomc_wrapper import GOMC
+
+
+def read_conf(filename):
+    """Keywords and values of a GOMC input file"""
+    values = {}
+    with open(filename) as f:
+        for line in f:
+            words = line.split()
+            if words and not words[0].startswith("#"):
+                values.setdefault(words[0], []).append(words[1:])
+    return values
+
+
+@pytest.fixture
+def gomc(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for file in ("param.inp", "box_0.pdb", "box_0.psf"):
+        (tmp_path / file).write_text(file + "\n")
+    gomc = GOMC()
+    gomc.set("Parameters", "param.inp")
+    gomc.set("Coordinates", 0, "box_0.pdb")
+    gomc.set("Structure", 0, "box_0.psf")
+    gomc.set("Temperature", 300)
+    return gomc
+
+
+def test_sweep_grid(gomc):
+    jobs = gomc.sweep({"Temperature": [280, 320], "RunSteps": [10, 20]},
+                      verbose=False)
+    assert len(jobs) == 4
+    with open(os.path.join("sweep", "sweep.json")) as f:
+        index = json.load(f)
+    assert [job['changes'] for job in index] == [
+        {"Temperature": 280, "RunSteps": 10}, {"Temperature": 280, "RunSteps": 20},
+        {"Temperature": 320, "RunSteps": 10}, {"Temperature": 320, "RunSteps": 20}]
+    for (wd, variant), job in zip(jobs, index):
+        assert wd == os.path.join("sweep", job['directory'])
+        conf = read_conf(os.path.join(wd, "in.conf"))
+        assert float(conf["Temperature"][0][0]) == job['changes']["Temperature"]
+        assert int(conf["RunSteps"][0][0]) == job['changes']["RunSteps"]
+        assert conf["Coordinates"] == [["0", "box_0.pdb"]]
+        for file in ("param.inp", "box_0.pdb", "box_0.psf"):
+            with open(os.path.join(wd, file)) as f:
+                assert f.read() == file + "\n"
+
+    # the base object is not changed
+    gomc.write("base.conf", verbose=False)
+    assert float(read_conf("base.conf")["Temperature"][0][0]) == 300
+
+
+def test_sweep_missing_input(gomc):
+    os.remove("box_0.psf")
+    with pytest.raises(FileNotFoundError, match="box_0.psf"):
+        gomc.sweep([{"Temperature": 280}], verbose=False)
+    jobs = gomc.sweep([{"Temperature": 280}], verbose=False, allow_missing=True)
+    assert not os.path.exists(os.path.join(jobs[0][0], "box_0.psf"))
+    assert os.path.isfile(os.path.join(jobs[0][0], "box_0.pdb"))
@@ -0,0 +1,33 @@
+import numpy as np
+from gomc_wrapper import build_molecules
+
+
+def dihedral(A, B, C, D):
+    """Dihedral A-B-C-D in degrees over the batch"""
+    b1, b2, b3 = B - A, C - B, D - C
+    n1, n2 = np.cross(b1, b2), np.cross(b2, b3)
+    y = np.linalg.norm(b2, axis=-1) * np.sum(b1 * n2, axis=-1)
+    x = np.sum(n1 * n2, axis=-1)
+    return np.rad2deg(np.arctan2(y, x))
+
+
+def test_default_trans_in_non_planar_chain():
+    bonds = {f'C{i},C{i + 1}': 1.54 for i in range(1, 5)}
+    angles = {f'C{i},C{i + 1},C{i + 2}': 112.0 for i in range(1, 4)}
+    dihedrals = {'C1,C2,C3,C4': [60.0, -60.0, 90.0]}
+    labels, coords = build_molecules(bonds, angles, dihedrals)
+    C = [coords[:, labels.index(f'C{i}')] for i in range(1, 6)]
+
+    assert np.allclose(dihedral(*C[:4]), [60.0, -60.0, 90.0])
+    assert np.allclose(np.abs(dihedral(*C[1:])), 180.0)
+    assert np.allclose(np.linalg.norm(C[4] - C[3], axis=-1), 1.54)
+
+
+def test_explicit_dihedral():
+    bonds = {f'C{i},C{i + 1}': 1.54 for i in range(1, 5)}
+    angles = {f'C{i},C{i + 1},C{i + 2}': 112.0 for i in range(1, 4)}
+    dihedrals = {'C1,C2,C3,C4': 60.0, 'C2,C3,C4,C5': -65.0}
+    labels, coords = build_molecules(bonds, angles, dihedrals)
+    C = [coords[:, labels.index(f'C{i}')] for i in range(1, 6)]
+
+    assert np.allclose(dihedral(*C[1:]), -65.0)